@@ -0,0 +1,253 @@
+import json
+import random
+import asyncio
+from urllib.parse import urlsplit
+import aiohttp
+import Snpcore
+import Snphttp
+import Snpjob
+import Snptrace
+
+
+# Constants
+###########################################################################################
+# Requests running at the same time for each service
+ESEARCH_CONCURRENCY = 3
+ENSEMBL_CONCURRENCY = 4
+
+
+# Rate limiter class
+###########################################################################################
+class Asyncbucket():
+    '''asyncio token bucket allowing rate requests per second'''
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = None
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        '''Waits until a request may be sent'''
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            while True:
+                now = loop.time()
+                if self.updated is not None:
+                    self.tokens = min(self.capacity, self.tokens +
+                                      (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(max(self.blocked_until - now,
+                                        (1 - self.tokens) / self.rate))
+
+    def block(self, seconds):
+        '''Stops every request to the service for seconds (e.g. after a 429 Retry-After)'''
+        self.blocked_until = max(self.blocked_until,
+                                 asyncio.get_running_loop().time() + seconds)
+        self.tokens = 0
+
+
+class Service():
+    '''Concurrency and rate limits of one web service'''
+
+    def __init__(self, server, concurrency, rate, stage):
+        self.server = server
+        self.stage = stage
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = Asyncbucket(rate)
+
+    async def request(self, session, method, ext, read=None, **kwargs):
+        '''Sends a request to the service, retrying throttled and failed ones.
+                read (optional) is a coroutine function reading the response into the result
+                Output = the result of read, by default the decoded json response'''
+        async with self.semaphore:
+            for attempt in range(Snphttp.RETRIES):
+                await self.bucket.acquire()
+                try:
+                    with Snptrace.span(self.stage, concurrent=True) as span:
+                        async with session.request(method, self.server + ext, **kwargs) as response:
+                            if response.status in Snphttp.RETRY_STATUS and attempt < Snphttp.RETRIES - 1:
+                                wait = Delay(attempt, response.headers)
+                                if response.status == 429:
+                                    self.bucket.block(wait)
+                                else:
+                                    await asyncio.sleep(wait)
+                                continue
+                            response.raise_for_status()
+                            if read:
+                                result = await read(response)
+                            else:
+                                content = await response.read()
+                            span.set(bytes=response.content.total_bytes)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt == Snphttp.RETRIES - 1:
+                        raise
+                    await asyncio.sleep(Delay(attempt))
+                    continue
+                if read:
+                    return result
+                with Snptrace.span('decode', bytes=len(content)):
+                    return json.loads(content)
+
+
+def Delay(attempt, headers=None):
+    '''Returns the seconds to wait before retrying, from Retry-After if the server sent it'''
+    if headers and 'Retry-After' in headers:
+        try:
+            return min(float(headers['Retry-After']), Snphttp.MAX_BACKOFF)
+        except ValueError:
+            pass
+    return min(Snphttp.BACKOFF * 2 ** attempt, Snphttp.MAX_BACKOFF) * (0.5 + random.random() / 2)
+
+
+async def Readrecords(response, parse=None, save=None):
+    '''Decodes an Ensembl variation response record by record while it streams in (see Snpcore.Ensemblbatch),
+            save (optional) gets the json texts of the records every Snpcore.FLUSH_RECORDS records
+            Output = dict of rsID -> parse(record)'''
+    decoder = Snpcore.Recorddecoder(keeptext=save is not None)
+    records, texts = {}, ({} if save else None)
+    async for chunk in response.content.iter_chunked(Snpjob.CHUNK_BYTES):
+        Snpcore.Decodechunk(decoder, chunk, parse, records, texts, save=save)
+    Snpcore.Decodechunk(decoder, b'', parse, records, texts, final=True, save=save)
+    return records
+
+
+# Pipeline class
+###########################################################################################
+class Pipeline():
+    '''Runs the esearch of many genes/regions at the same time and starts the Ensembl
+    batch fetches of a gene as soon as its UIDs arrive'''
+
+    def __init__(self, clinsignificance='No Filtering', common=False, retstart=0, retmax=100, fetch_all=False,
+                 batch_size=None, esearch_concurrency=ESEARCH_CONCURRENCY, ensembl_concurrency=ENSEMBL_CONCURRENCY):
+        self.clinsignificance = clinsignificance
+        self.common = common
+        self.retstart = retstart
+        self.retmax = retmax
+        self.fetch_all = fetch_all
+        self.batch_size = min(batch_size or Snpcore.BATCH_SIZE,
+                              Snpcore.BATCH_SIZE)
+        self.esearch_concurrency = esearch_concurrency
+        self.ensembl_concurrency = ensembl_concurrency
+
+    async def esearch(self, session, query):
+        '''Yields the UID pages of a gene/region query'''
+        if Snpcore.INDEX:
+            found = Snpcore.INDEX.search(query, self.clinsignificance, self.common)
+            end = None if self.fetch_all else self.retstart + self.retmax
+            yield found[self.retstart:end].tolist(), len(found)
+            return
+        term = Snpcore.esearch_term(
+            query, self.clinsignificance, self.common)
+        key = f'&api_key={Snpcore.NCBI_API_KEY}' if Snpcore.NCBI_API_KEY else ''
+        page_size = Snpcore.ESEARCH_PAGE if self.fetch_all else self.retmax
+        url = f'/entrez/eutils/esearch.fcgi?db=snp&retmode=json&sort=SNP_ID&retmax={page_size}{key}'
+        retstart = self.retstart
+        data = (await self.eutils.request(session, 'GET',
+                                          f'{url}&term={term}&usehistory=y&retstart={retstart}'))['esearchresult']
+        count = int(data['count'])
+        # only the first response has the history of the search, the later pages reuse it
+        history = f"&WebEnv={data['webenv']}&query_key={data['querykey']}"
+        while True:
+            page = [int(x) for x in data['idlist']]
+            yield page, count
+            retstart += len(page)
+            if not self.fetch_all or not page or retstart >= count:
+                break
+            data = (await self.eutils.request(session, 'GET',
+                                              f'{url}{history}&retstart={retstart}'))['esearchresult']
+
+    async def batch(self, session, UIDlist):
+        '''Fetches one batch and merges it into the record store, with a VCF source
+                only the phenotypes of the SNPs found locally are fetched from Ensembl'''
+        ext = "/variation/homo_sapiens?pops=1&phenotypes=1&population_genotypes=1"
+        newls = ["rs" + str(n) for n in UIDlist]
+        if Snpcore.VCF:
+            local = await asyncio.get_running_loop().run_in_executor(None, Snpcore.VCF.get, newls)
+            self.store.merge(local, Snpcore.VCF.ext)
+            await self.fetch(session, [uid for uid in newls if uid in local],
+                             "/variation/homo_sapiens?phenotypes=1")
+            newls = [uid for uid in newls if uid not in local]
+        await self.fetch(session, newls, ext)
+
+    async def fetch(self, session, newls, ext):
+        '''Fetches the rsIDs from the Ensembl ext endpoint, or the cache, into the record store'''
+        if not newls:
+            return
+        cache = Snpcore.CACHE
+        parse = self.store.parser(ext)
+        # the sqlite cache is used from the executor, it would hold up the other requests of the event loop
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, cache.get, newls, ext) if cache else {}
+        parsed = Snpcore.Parsed(cached, parse)
+        missing = [] if cache and cache.offline else [
+            uid for uid in newls if uid not in parsed]
+        if missing:
+            writes = []
+            # the texts are emptied once handed over, the executor gets a copy
+            save = None
+            if cache:
+                def save(texts):
+                    writes.append(loop.run_in_executor(None, cache.put, dict(texts), ext, True))
+            result = await self.ensembl.request(session, 'POST', ext,
+                                                read=lambda response: Readrecords(response, parse, save),
+                                                data=json.dumps({"ids": missing}),
+                                                headers={"Content-Type": "application/json",
+                                                         "Accept": "application/json"})
+            await asyncio.gather(*writes)
+            parsed.update(result)
+        self.store.add(parsed)
+
+    async def query(self, session, query, seen, tasks, log):
+        '''Runs the esearch of a query and schedules the Ensembl batches of each page'''
+        found = 0
+        async for page, count in self.esearch(session, query):
+            new = [uid for uid in page if uid not in seen]
+            seen.update(new)
+            found += len(page)
+            for batch in Snpcore.Batches(new, self.batch_size):
+                tasks.append(asyncio.ensure_future(
+                    self.batch(session, batch)))
+            if log:
+                log(f'{query}: SNPs: {found}/{count}')
+
+    async def run(self, queries, rsids=(), log=None):
+        '''Input = the gene/region queries and extra rsIDs
+                Output = the Snpcore.Recordstore of all the SNPs'''
+        self.eutils = Service(Snpcore.EUTILS_SERVER, self.esearch_concurrency, Snpcore.EUTILS_RATE, 'esearch')
+        self.ensembl = Service(Snpcore.ENSEMBL_SERVER, self.ensembl_concurrency,
+                               Snphttp.HOST_RATES.get(urlsplit(Snpcore.ENSEMBL_SERVER).hostname, Snphttp.DEFAULT_RATE),
+                               'ensembl')
+        self.store = Snpcore.Recordstore()
+        seen = set()
+        tasks = []
+        timeout = aiohttp.ClientTimeout(connect=Snphttp.TIMEOUT[0],
+                                        sock_read=Snphttp.TIMEOUT[1])
+        connector = aiohttp.TCPConnector(limit=Snphttp.POOL_SIZE)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            extra = sorted(set(int(str(rs).lower().strip('rs'))
+                               for rs in rsids))
+            seen.update(extra)
+            for batch in Snpcore.Batches(extra, self.batch_size):
+                tasks.append(asyncio.ensure_future(self.batch(session, batch)))
+            await asyncio.gather(*[self.query(session, query, seen, tasks, log) for query in queries])
+            await asyncio.gather(*tasks)
+        return self.store
+
+
+def Getstore(queries, rsids=(), log=None, **kwargs):
+    '''Runs the pipeline for the gene/region queries and rsIDs
+            Output = the Snpcore.Recordstore of the SNPs'''
+    return asyncio.run(Pipeline(**kwargs).run(queries, rsids, log))
+
+
+def Getdata(queries, rsids=(), log=None, **kwargs):
+    '''Runs the pipeline for the gene/region queries and rsIDs
+            Output = the table rows'''
+    return Getstore(queries, rsids, log, **kwargs).rows()
+
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+# Constants
+###########################################################################################
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.snpop', 'variants.sqlite')
+# Records older than this are fetched again (seconds)
+DEFAULT_TTL = 30 * 24 * 3600
+# Least recently used records above this count are evicted
+DEFAULT_MAX_ENTRIES = 200000
+# Records written between two evictions, the records are written a few at a time while they are decoded
+EVICT_ROWS = 2000
+
+
+def Flags(ext):
+    '''Returns the set of Ensembl options (e.g. pops, phenotypes) requested by an endpoint'''
+    if '?' not in ext:
+        return frozenset()
+    query = ext.split('?', 1)[1]
+    return frozenset(option.split('=')[0] for option in query.split('&')
+                     if option.endswith('=1'))
+
+
+# Cache class
+###########################################################################################
+class Variantcache():
+    '''On disk cache of decoded Ensembl variation records keyed by rsID and Ensembl release.
+
+    A record fetched with a set of options (pops, phenotypes, population_genotypes) also
+    serves requests for any subset of them. In offline mode no release check is done and
+    only the records of the newest cached release are served.'''
+
+    def __init__(self, path=DEFAULT_PATH, release_function=None, ttl=DEFAULT_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES, offline=False):
+        self.path = path
+        self.release_function = release_function
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.offline = offline
+        self.release = None
+        self.written = 0
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(
+            path, timeout=60, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS variants (rsid TEXT, flags TEXT, release INTEGER, '
+                'fetched REAL, used REAL, data TEXT, PRIMARY KEY (rsid, flags))')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS variants_used ON variants (used)')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS variants_fetched ON variants (fetched)')
+        # once per job as well, so runs writing less than EVICT_ROWS records don't grow the cache
+        self.evict()
+
+    def Release(self):
+        '''Returns the Ensembl release the cache serves, dropping the records of other releases'''
+        if self.release is None:
+            if self.offline or self.release_function is None:
+                with self.lock:
+                    row = self.connection.execute(
+                        'SELECT MAX(release) FROM variants').fetchone()
+                self.release = row[0] if row[0] is not None else 0
+            else:
+                self.release = int(self.release_function())
+                with self.lock, self.connection:
+                    self.connection.execute(
+                        'DELETE FROM variants WHERE release != ?', (self.release,))
+        return self.release
+
+    def get(self, rsids, ext):
+        '''Input = the rsIDs and the Ensembl endpoint they would be requested from
+                Output = a dict of the fresh cached records that include all the requested options'''
+        flags = Flags(ext)
+        release = self.Release()
+        oldest = 0 if self.offline else time.time() - self.ttl
+        found = {}
+        with self.lock:
+            for i in range(0, len(rsids), 500):
+                chunk = rsids[i:i + 500]
+                rows = self.connection.execute(
+                    f'SELECT rsid, flags, data FROM variants WHERE release = ? AND fetched >= ? '
+                    f'AND rsid IN ({",".join("?" * len(chunk))})', [release, oldest] + chunk).fetchall()
+                for rsid, rowflags, data in rows:
+                    if rsid not in found and flags <= frozenset(rowflags.split(',')) - {''}:
+                        found[rsid] = json.loads(data)
+            if found:
+                with self.connection:
+                    now = time.time()
+                    self.connection.executemany('UPDATE variants SET used = ? WHERE rsid = ?',
+                                                [(now, rsid) for rsid in found])
+        return found
+
+    def put(self, decoded, ext, encoded=False):
+        '''Stores the records of a decoded Ensembl response, with encoded the records are json texts already'''
+        if not decoded:
+            return
+        flags = ','.join(sorted(Flags(ext)))
+        release = self.Release()
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO variants VALUES (?, ?, ?, ?, ?, ?)',
+                                        [(rsid, flags, release, now, now, record if encoded else json.dumps(record))
+                                         for rsid, record in decoded.items()])
+            self.written += len(decoded)
+            evict = self.written >= EVICT_ROWS
+        if evict:
+            self.evict()
+
+    def evict(self):
+        '''Removes the expired records and the least recently used ones above max_entries,
+                put() runs it once every EVICT_ROWS records written'''
+        with self.lock, self.connection:
+            self.written = 0
+            if not self.offline:
+                self.connection.execute('DELETE FROM variants WHERE fetched < ?',
+                                        (time.time() - self.ttl,))
+            count = self.connection.execute(
+                'SELECT COUNT(*) FROM variants').fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute('DELETE FROM variants WHERE rowid IN '
+                                        '(SELECT rowid FROM variants ORDER BY used LIMIT ?)',
+                                        (count - self.max_entries,))
+
+    def clear(self):
+        '''Removes all the records'''
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM variants')
+
+    def close(self):
+        if self.written:
+            self.evict()
+        self.connection.close()
+
+
+def Defaultcache(release_function=None):
+    '''Creates the cache from the SNPOP_CACHE (path or 'off'), SNPOP_CACHE_TTL (days)
+            and SNPOP_OFFLINE environment variables'''
+    path = os.environ.get('SNPOP_CACHE', DEFAULT_PATH)
+    if path.lower() in ('off', 'none', '0', ''):
+        return None
+    ttl = float(os.environ.get('SNPOP_CACHE_TTL', DEFAULT_TTL / 86400)) * 86400
+    offline = os.environ.get('SNPOP_OFFLINE', '0').lower() in ('1', 'true', 'yes')
+    return Variantcache(path, release_function, ttl=ttl, offline=offline)
@@ -0,0 +1,1050 @@
+import os
+import re
+import sys
+import json
+import codecs
+import math
+import argparse
+from itertools import islice
+from urllib.parse import urlsplit
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import Snpcache
+import Snphttp
+import Snpjob
+import Snptrace
+
+
+# Constants
+###########################################################################################
+# Servers can be replaced (e.g. by the benchmarks/standin.py server) with environment variables
+EUTILS_SERVER = os.environ.get('SNPOP_EUTILS_SERVER', 'https://eutils.ncbi.nlm.nih.gov')
+ENSEMBL_SERVER = os.environ.get('SNPOP_ENSEMBL_SERVER', 'https://rest.ensembl.org')
+
+# Optional NCBI API key, raises the E-utilities limit from 3 to 10 requests per second
+NCBI_API_KEY = os.environ.get('NCBI_API_KEY')
+EUTILS_RATE = 10 if NCBI_API_KEY else 3
+# UIDs per esearch page when retrieving all the hits of a search
+ESEARCH_PAGE = 10000
+
+# Ensembl accepts at most 200 ids per POST /variation/homo_sapiens request
+BATCH_SIZE = 200
+# Number of Ensembl batches fetched at the same time
+MAX_INFLIGHT = 4
+# Endpoint of the batched SNP summaries, the records are the ones of the single SNP summary request
+SUMMARY_EXT = "/variation/homo_sapiens?phenotypes=1"
+
+# Snpcache.Variantcache used for the Ensembl variation records (None disables caching)
+CACHE = None
+# Snpindex.Variantindex searching the genes/regions offline (None uses the NCBI esearch)
+INDEX = None
+# Snpvcf.Vcfsource computing the population and genotype frequencies from local VCFs (None uses Ensembl)
+VCF = None
+
+# Ensembl populations that can become columns of the data table: (population, column label)
+POPULATION_SETS = {
+    '1000G': [('1000GENOMES:phase_3:ALL', 'Total'), ('1000GENOMES:phase_3:AFR', 'African'),
+              ('1000GENOMES:phase_3:EUR', 'European'), ('1000GENOMES:phase_3:AMR', 'American'),
+              ('1000GENOMES:phase_3:EAS', 'East Asian'), ('1000GENOMES:phase_3:SAS', 'South Asian')],
+    '1000G-sub': [(f'1000GENOMES:phase_3:{code}', name) for code, name in [
+        ('ACB', 'African Caribbean'), ('ASW', 'African American SW'), ('BEB', 'Bengali'),
+        ('CDX', 'Chinese Dai'), ('CEU', 'CEPH'), ('CHB', 'Han Chinese'), ('CHS', 'Southern Han Chinese'),
+        ('CLM', 'Colombian'), ('ESN', 'Esan'), ('FIN', 'Finnish'), ('GBR', 'British'),
+        ('GIH', 'Gujarati'), ('GWD', 'Gambian'), ('IBS', 'Iberian'), ('ITU', 'Telugu'),
+        ('JPT', 'Japanese'), ('KHV', 'Kinh Vietnamese'), ('LWK', 'Luhya'), ('MSL', 'Mende'),
+        ('MXL', 'Mexican Ancestry'), ('PEL', 'Peruvian'), ('PJL', 'Punjabi'), ('PUR', 'Puerto Rican'),
+        ('STU', 'Sri Lankan Tamil'), ('TSI', 'Toscani'), ('YRI', 'Yoruba')]],
+    'gnomADg': [(f'gnomADg:{code}', f'gnomAD genomes {name}') for code, name in [
+        ('ALL', 'Total'), ('afr', 'African'), ('ami', 'Amish'), ('amr', 'American'),
+        ('asj', 'Ashkenazi Jewish'), ('eas', 'East Asian'), ('fin', 'Finnish'),
+        ('mid', 'Middle Eastern'), ('nfe', 'Non-Finnish European'), ('sas', 'South Asian'),
+        ('oth', 'Other')]],
+    'gnomADe': [(f'gnomADe:{code}', f'gnomAD exomes {name}') for code, name in [
+        ('ALL', 'Total'), ('afr', 'African'), ('amr', 'American'), ('asj', 'Ashkenazi Jewish'),
+        ('eas', 'East Asian'), ('fin', 'Finnish'), ('nfe', 'Non-Finnish European'),
+        ('sas', 'South Asian'), ('oth', 'Other')]],
+}
+DEFAULT_POPULATIONS = POPULATION_SETS['1000G']
+# Populations shown as columns, in column order
+POPULATIONS = DEFAULT_POPULATIONS
+
+COLUMNS = [' SNP ', 'Chromosome', 'Position', 'Minor allele', 'Major allele', 'Total minor allele frequency', 'Total major allele frequency', 'African minor allele frequency ',
+           'African major allele frequency', 'European minor allele frequency', 'European major allele frequency', 'American minor allele frequency', 'American major allele frequency',
+           'East Asian minor allele frequency', 'East Asian major allele frequency', 'South Asian minor allele frequency', 'South Asian major allele frequency',
+           'Function', 'Gene', 'Minor allele traits', 'Major allele traits', 'Clinical Significance', 'Total heterozygous', 'Total minor allele homozygous', 'Total major allele homozygous',
+           'African heterozygous', 'African minor allele homozygous', 'African major allele homozygous', 'European heterozygous', 'European minor allele homozygous', 'European major allele homozygous',
+           'American heterozygous', 'American minor allele homozygous', 'American major allele homozygous', 'East Asian heterozygous', 'East Asian minor allele homozygous', 'East Asian major allele homozygous',
+           'South Asian heterozygous', 'South Asian minor allele homozygous', 'South Asian major allele homozygous']
+
+NO_GENE = '(optional)'
+# Genotype classes in the column order of the data table
+GENOTYPES = ['heterozygous', 'minorhomozygous', 'majorhomozygous']
+
+
+def Populationcolumns(populations=None):
+    '''Returns the population -> column index lookup of the populations'''
+    return {population: i for i, (population, label) in enumerate(populations or POPULATIONS)}
+
+
+def Intern(value):
+    '''Returns the interned copy of a string, the strings repeated over many SNPs (alleles, consequences,
+            chromosomes, genes) are then stored once'''
+    return sys.intern(value) if type(value) is str else value
+
+
+def Populations(names):
+    '''Input = population set names (e.g. 1000G-sub, gnomADg) and/or Ensembl population names
+            Output = the (population, column label) list'''
+    populations = []
+    for name in names:
+        for population in POPULATION_SETS.get(name, [(name, name)]):
+            if population not in populations:
+                populations.append(population)
+    return populations
+
+
+if os.environ.get('SNPOP_POPULATIONS'):
+    POPULATIONS = Populations(os.environ['SNPOP_POPULATIONS'].split(','))
+
+
+def Columns(populations=None):
+    '''Returns the data table header for the populations'''
+    populations = populations or POPULATIONS
+    if populations == DEFAULT_POPULATIONS:
+        return list(COLUMNS)
+    columns = COLUMNS[:5]
+    for population, label in populations:
+        columns += [f'{label} minor allele frequency',
+                    f'{label} major allele frequency']
+    columns += COLUMNS[17:22]
+    for population, label in populations:
+        columns += [f'{label} heterozygous', f'{label} minor allele homozygous',
+                    f'{label} major allele homozygous']
+    return columns
+
+
+# Functions for searching SNPs in dbSNP
+###########################################################################################
+
+def Parsequery(gene):
+    '''Input = gene name/chromosome/region
+            Output = ('gene', name), ('chromosome', chromosome), ('region', (chromosome, start, end))
+            or ('none', None) when no gene was given'''
+    if not gene or gene == NO_GENE:
+        return 'none', None
+    if gene.isnumeric() or (gene == 'Y' or gene == 'X'):
+        return 'chromosome', gene
+    if ':' not in gene:
+        return 'gene', gene
+    if '-' in gene:
+        x = gene.split(':')
+        y = x[1].split('-')
+        if y[0].isnumeric() and y[1].isnumeric():
+            return 'region', (x[0], int(y[0]), int(y[1]))
+    raise ValueError(f'Invalid gene/chromosome/region: {gene}')
+
+
+def esearch_term(gene, clinsignificance, common):
+    '''Input = gene name/chromosome/region, clinical significance filter and the common variants filter
+            Output = the dbSNP esearch term'''
+    term = '1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]'
+    if common:
+        term += '+AND+00000.0100:+00001.0000[GLOBAL_MAF]'
+    else:
+        term += '+NOT+00000.0000[Global Minor Allele Frequency]'
+    if clinsignificance and clinsignificance != 'No Filtering':
+        clinsignificance1 = str(clinsignificance).replace(' ', '+')
+        term += f'+AND+{clinsignificance1}[Clinical Significance]'
+    kind, value = Parsequery(gene)
+    if kind == 'chromosome':
+        term += f'+AND+{value}[Chromosome]'
+    elif kind == 'gene':
+        term += f'+AND+{value}[Gene Name]'
+    elif kind == 'region':
+        chrom, bpstart, bpend = value
+        term += f'+AND+({chrom}[Chromosome]+AND+({bpstart}[CHRPOS]+:+{bpend}[CHRPOS]))'
+    return term
+
+
+Snphttp.CLIENT.set_rate(urlsplit(EUTILS_SERVER).hostname, EUTILS_RATE)
+
+
+def Eutilsget(url, job=None):
+    '''Gets an E-utilities url through the shared client, which keeps to EUTILS_RATE requests per second'''
+    if NCBI_API_KEY:
+        url += f'&api_key={NCBI_API_KEY}'
+    return Snphttp.CLIENT.get(url, job)
+
+
+def Esearch(url, job=None):
+    '''Runs an esearch url and returns its decoded esearchresult'''
+    with Snptrace.span('esearch') as span:
+        content = Eutilsget(url, job).content
+        data = json.loads(content)['esearchresult']
+        span.set(bytes=len(content), rows=len(data['idlist']))
+    return data
+
+
+def available_SNV(retstart, retmax, gene, clinsignificance, common=False, checkpoint=None):
+    '''Input = from wich row in the database should the results begin, the number of results you want
+            Output = the sorted list of available UIDs based on the inputs and the total number of hits'''
+    if INDEX:
+        found = INDEX.search(gene, clinsignificance, common)
+        return found[retstart:retstart + retmax].tolist(), len(found)
+    if checkpoint and checkpoint.searched(gene):
+        return checkpoint.searched(gene)[0]
+    term = esearch_term(gene, clinsignificance, common)
+    data = Esearch(
+        f'{EUTILS_SERVER}/entrez/eutils/esearch.fcgi?db=snp&term={term}&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
+    strlist = (data['idlist'])
+    numlist = [int(x) for x in strlist]
+    UIDlist = sorted(numlist)
+    if checkpoint:
+        checkpoint.addpage(gene, UIDlist, int(data['count']))
+    return UIDlist, int(data['count'])
+
+
+def esearch_pages(gene, clinsignificance, common=False, retstart=0, page_size=None, job=None, checkpoint=None):
+    '''Pages through all the hits of a search using the NCBI history server.
+            With a Snpjob.Checkpoint the pages saved by an earlier run come first and the search resumes after them.
+            Output = yields the UIDs of each page and the total number of hits'''
+    if checkpoint:
+        saved = checkpoint.searched(gene)
+        for page, count in saved:
+            yield page, count
+            retstart += len(page)
+        if saved and (not saved[-1][0] or retstart >= saved[-1][1]):
+            return
+        for page, count in esearch_pages(gene, clinsignificance, common, retstart, page_size, job):
+            checkpoint.addpage(gene, page, count)
+            yield page, count
+        return
+    if INDEX:
+        found = INDEX.search(gene, clinsignificance, common)
+        yield found[retstart:].tolist(), len(found)
+        return
+    page_size = page_size or ESEARCH_PAGE
+    term = esearch_term(gene, clinsignificance, common)
+    url = f'{EUTILS_SERVER}/entrez/eutils/esearch.fcgi?db=snp&retmode=json&sort=SNP_ID&retmax={page_size}'
+    data = Esearch(f'{url}&term={term}&usehistory=y&retstart={retstart}', job)
+    count = int(data['count'])
+    history = f"&WebEnv={data['webenv']}&query_key={data['querykey']}"
+    while True:
+        page = [int(x) for x in data['idlist']]
+        yield page, count
+        retstart += len(page)
+        if not page or retstart >= count:
+            break
+        data = Esearch(f'{url}{history}&retstart={retstart}', job)
+
+
+def all_SNV(gene, clinsignificance, common=False, retstart=0, callback=None, job=None, checkpoint=None):
+    '''Retrieves all the UIDs of a search from retstart on, passing each page and the number
+            of hits to callback as they arrive. job (optional Snpjob.Job) reports every page and can cancel the search.
+            Output = the sorted list of UIDs and the total number of hits'''
+    UIDlist = []
+    count = 0
+    for page, count in esearch_pages(gene, clinsignificance, common, retstart, job=job, checkpoint=checkpoint):
+        if job:
+            if not UIDlist:
+                remaining = max(count - retstart, 0)
+                job.add(math.ceil(remaining / max(len(page), 1)), remaining)
+            job.advance(1, len(page))
+            job.report()
+        UIDlist += page
+        if callback:
+            callback((page, count))
+    return sorted(UIDlist), count
+
+
+# Functions for fetching SNP data from Ensembl
+###########################################################################################
+
+def infosum(uid, job=None):
+    '''creates the data summary for the SNV'''
+    rsSNV = 'rs' + str(uid)
+    ext = f"/variation/human/{rsSNV}?phenotypes=1"
+    cached = CACHE.get([rsSNV], ext) if CACHE else {}
+    if rsSNV in cached:
+        r = cached[rsSNV]
+    elif CACHE and CACHE.offline:
+        raise KeyError(f'{rsSNV} is not cached (offline mode)')
+    else:
+        r = Snphttp.CLIENT.get(
+            ENSEMBL_SERVER+ext, job, headers={"Content-Type": "application/json"}).json()
+        if CACHE:
+            CACHE.put({rsSNV: r}, ext)
+    return Summarytext(rsSNV, r)
+
+
+def Summaries(UIDlist, job=None):
+    '''Creates the data summaries of many SNVs with the batched POST requests of Ensemblstream (and CACHE)
+            Output = dict of UID (str) -> summary, the SNVs without a record or mapping are left out'''
+    summaries = {}
+    for decoded in Ensemblstream(UIDlist, SUMMARY_EXT, job=job):
+        for rsSNV, r in decoded.items():
+            try:
+                summaries[rsSNV[2:]] = Summarytext(rsSNV, r)
+            except (KeyError, IndexError):
+                continue
+    return summaries
+
+
+def Summarytext(rsSNV, r):
+    '''Formats the data summary of a decoded phenotypes=1 record'''
+    Seq = r['mappings'][0]['allele_string']
+    Minor_Allele = r['minor_allele']
+    func = r['most_severe_consequence']
+    clinical = ''
+    Traits = ''
+    AltTraits = ''
+    Gene = ''
+    if r['phenotypes']:
+        for items in r['phenotypes']:
+            if 'risk_allele' in items:
+                if 'genes' in items:
+                    Gene = items['genes']
+                if items['risk_allele'] == Minor_Allele:
+                    Trait = items['trait']
+                    if Trait not in Traits:
+                        Traits += f'{Trait}\n'
+                elif items['risk_allele'] != Minor_Allele:
+                    AltTrait = str(items['risk_allele']) + \
+                        '->'+str(items['trait']).lower()
+                    if AltTrait not in AltTraits:
+                        AltTraits += f'{AltTrait}\n'
+    try:
+        for item in r['clinical_significance']:
+            clinical += f'{item}\n'
+    except KeyError:
+        clinical += 'N\\A'
+    return (f"Name={rsSNV}\n"
+            "\n"
+            f"Minor Allele={Minor_Allele}\n"
+            "\n"
+            f"Sequence={Seq}\n"
+            "\n"
+            f"Gene={Gene}\n"
+            "\n"
+            f"Function=\n{func}\n"
+            "\n"
+            f"Traits=\n{Traits.lower()}"
+            "\n"
+            f"Major Allele Traits=\n{AltTraits}"
+            "\n"
+            f"Clinical Significance=\n{clinical}"
+            )
+
+
+def Ensemblrelease():
+    '''Returns the current Ensembl release'''
+    r = Snphttp.CLIENT.get(ENSEMBL_SERVER+"/info/data",
+                           headers={"Content-Type": "application/json"})
+    return max(json.loads(r.content)['releases'])
+
+
+# Streaming decode of the Ensembl responses
+###########################################################################################
+DECODER = json.JSONDecoder()
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+# Records whose json text is held before it is written to the cache and the checkpoint
+FLUSH_RECORDS = 32
+
+
+class Recorddecoder():
+    '''Incremental decoder of an Ensembl variation POST response, one json object of rsID -> record.
+    The body is fed chunk by chunk as it arrives and every record is decoded as soon as its text is complete,
+    so only the text of the records not complete yet is buffered, never the whole response.'''
+
+    def __init__(self, keeptext=False):
+        self.keeptext = keeptext
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pieces = []
+        self.buffered = 0
+        self.wanted = 0
+        self.started = False
+        self.finished = False
+        self.members = 0
+
+    def feed(self, chunk, final=False):
+        '''Input = the next chunk of the body (bytes), final for the last one
+                Output = list of the (rsID, record, record json text or None) completed by the chunk'''
+        piece = self.utf8.decode(chunk, final)
+        self.pieces.append(piece)
+        self.buffered += len(piece)
+        decoded = []
+        # a record cut by the end of a chunk is only decoded again once the buffer doubled,
+        # so a record spread over many chunks isn't scanned once per chunk
+        if self.buffered < self.wanted and not final:
+            return decoded
+        self.text = ''.join(self.pieces)
+        position = 0
+        while not self.finished:
+            try:
+                item, position = self.member(position)
+            except ValueError:
+                if final:
+                    raise
+                break
+            if item:
+                decoded.append(item)
+        if self.finished:
+            position = WHITESPACE.match(self.text, position).end()
+            if position < len(self.text):
+                raise json.JSONDecodeError('Extra data', self.text, position)
+        self.text = self.text[position:]
+        self.pieces = [self.text]
+        self.buffered = self.wanted = len(self.text)
+        self.wanted *= 2
+        if final and not self.finished:
+            raise json.JSONDecodeError('Unterminated object', self.text, len(self.text))
+        return decoded
+
+    def member(self, position):
+        '''Decodes the next part of the object from position on: its opening brace, a member or its closing brace
+                Output = the (rsID, record, json text or None) of a member (None for a brace) and the position after it.
+                Raises ValueError if the text ends before the part does'''
+        text = self.text
+        position = WHITESPACE.match(text, position).end()
+        if not self.started:
+            self.expect(position, '{')
+            self.started = True
+            return None, position + 1
+        if self.members and self.expect(position, ',}') == ',':
+            position = WHITESPACE.match(text, position + 1).end()
+            self.expect(position, '"')
+        elif self.expect(position, '"}') == '}':
+            self.finished = True
+            return None, position + 1
+        rsid, position = DECODER.raw_decode(text, position)
+        position = WHITESPACE.match(text, position).end()
+        self.expect(position, ':')
+        start = WHITESPACE.match(text, position + 1).end()
+        record, position = DECODER.raw_decode(text, start)
+        # a number cut by the end of the chunk would decode, the member only ends at the next , or }
+        self.expect(WHITESPACE.match(text, position).end(), ',}')
+        self.members += 1
+        return (rsid, record, text[start:position] if self.keeptext else None), position
+
+    def expect(self, position, characters):
+        '''Output = the character at position, raises ValueError if it is not one of characters'''
+        if position >= len(self.text):
+            raise json.JSONDecodeError('Unexpected end of data', self.text, position)
+        if self.text[position] not in characters:
+            raise json.JSONDecodeError(f'Expecting {" or ".join(characters)}', self.text, position)
+        return self.text[position]
+
+
+def Decodechunk(decoder, chunk, parse, records, texts=None, final=False, save=None):
+    '''Feeds a chunk of a response body to a Recorddecoder and keeps the records it completed:
+            parse(record) (the record itself without parse) in records and their json text in texts (optional).
+            save (optional) is handed the texts and empties them once FLUSH_RECORDS are held and with the final chunk'''
+    with Snptrace.span('decode', bytes=len(chunk)) as span:
+        decoded = decoder.feed(chunk, final)
+        span.set(rows=len(decoded))
+    with Snptrace.span('parse', rows=len(decoded)):
+        for rsid, record, text in decoded:
+            records[rsid] = parse(record) if parse else record
+            if texts is not None:
+                texts[rsid] = text
+    if save and texts and (final or len(texts) >= FLUSH_RECORDS):
+        save(texts)
+        texts.clear()
+
+
+def Ensemblbatch(newls, ext, job=None, parse=None, save=None):
+    '''Posts one batch of rsIDs to the Ensembl variation endpoint and decodes the response record by record
+            while it streams in, each record is handed to parse (optional, e.g. Recordstore.parser) right away.
+            save (optional) gets the json texts of the records every FLUSH_RECORDS records (for the cache and the checkpoint),
+            so the texts of a whole batch are never held.
+            Output = dict of rsID -> parsed record'''
+    data = json.dumps({"ids": newls})
+    headers = {"Content-Type": "application/json",
+               "Accept": "application/json"}
+    decoder = Recorddecoder(keeptext=save is not None)
+    records, texts = {}, ({} if save else None)
+    received = 0
+    with Snptrace.span('ensembl', ids=len(newls)) as span:
+        r = Snphttp.CLIENT.post(ENSEMBL_SERVER+ext, job, stream=True, headers=headers,
+                                data=data)
+        with r:
+            for chunk in (job.chunks(r) if job else r.iter_content(Snpjob.CHUNK_BYTES)):
+                received += len(chunk)
+                Decodechunk(decoder, chunk, parse, records, texts, save=save)
+            Decodechunk(decoder, b'', parse, records, texts, final=True, save=save)
+        span.set(bytes=received)
+    return records
+
+
+def Batches(items, size):
+    '''Splits a list into consecutive lists of at most size items'''
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def Storetexts(texts, ext, checkpoint=None):
+    '''Keeps records (json texts) of a batch being decoded in CACHE and in the checkpoint (optional)'''
+    if CACHE:
+        with Snptrace.span('cache', rows=len(texts)):
+            CACHE.put(texts, ext, encoded=True)
+    if checkpoint:
+        with Snptrace.span('checkpoint', rows=len(texts)):
+            checkpoint.addrecords(ext, texts, encoded=True)
+
+
+def Parsed(decoded, parse=None):
+    '''Output = the decoded records turned into parse(record), the records themselves without parse'''
+    if parse is None:
+        return decoded
+    with Snptrace.span('parse', rows=len(decoded)):
+        return {rsid: parse(record) for rsid, record in decoded.items()}
+
+
+def Ensemblstream(UIDlist, ext, batch_size=None, inflight=None, job=None, checkpoint=None, parse=None):
+    '''Posts the rsIDs to the Ensembl variation endpoint in batches of at most batch_size ids,
+            fetching up to inflight batches at the same time, and yields each decoded batch as soon as it completes.
+            A batch is only sent once the result of an earlier one was taken, so a slow consumer holds the requests back.
+            Records found in CACHE or in the batches saved by the checkpoint (optional Snpjob.Checkpoint)
+            are yielded first and not requested again.
+            job (optional Snpjob.Job) counts the batches and stops the stream once cancelled.
+            parse (optional) turns every record into what is yielded of it as soon as the record is decoded.'''
+    batch_size = min(batch_size or BATCH_SIZE, BATCH_SIZE)
+    inflight = inflight or MAX_INFLIGHT
+    newls = [("rs" + str(n).lower().strip('rs')) for n in UIDlist]
+    with Snptrace.span('cache') as span:
+        cached = CACHE.get(newls, ext) if CACHE else {}
+        span.set(rows=len(cached))
+    if cached:
+        yield Parsed(cached, parse)
+    fetched = set()
+    if checkpoint:
+        fetched, saved = checkpoint.fetched(ext, newls)
+        if saved:
+            yield Parsed(saved, parse)
+    if CACHE and CACHE.offline:
+        missing = []
+    else:
+        missing = [uid for uid in newls if uid not in cached and uid not in fetched]
+    batches = Batches(missing, batch_size)
+    if job:
+        job.add(len(batches))
+    save = (lambda texts: Storetexts(texts, ext, checkpoint)) if CACHE or checkpoint else None
+    if len(batches) <= 1 or inflight == 1:
+        for batch in batches:
+            result = Ensemblbatch(batch, ext, job, parse, save)
+            if checkpoint:
+                checkpoint.addbatch(ext, batch)
+            if job:
+                job.advance(1)
+            yield result
+        return
+    executor = ThreadPoolExecutor(max_workers=min(inflight, len(batches)))
+    queued = iter(batches)
+    pending = set()
+    requested = {}
+    try:
+        while True:
+            for batch in islice(queued, inflight - len(pending)):
+                future = executor.submit(Ensemblbatch, batch, ext, job, parse, save)
+                requested[future] = batch
+                pending.add(future)
+            if not pending:
+                break
+            done, pending = wait(pending, timeout=Snpjob.POLL if job else None,
+                                 return_when=FIRST_COMPLETED)
+            if job:
+                job.check()
+            for future in done:
+                result = future.result()
+                batch = requested.pop(future)
+                if checkpoint:
+                    checkpoint.addbatch(ext, batch)
+                if job:
+                    job.advance(1)
+                yield result
+    finally:
+        # a cancelled job doesn't wait for the requests still waiting for a response
+        executor.shutdown(wait=not (job and job.cancelled), cancel_futures=True)
+
+
+def Phenrecord(record):
+    '''Parses the function, gene, trait and clinical significance data of one decoded phenotypes=1 record
+            Output = [function, gene, traits, alternative traits, clinical significance]'''
+    AltTraitsstring = ''
+    Traitstring = ''
+    Gene = ''
+    function = record.get('most_severe_consequence', 'Not specified')
+    try:
+        clinical = str(record["clinical_significance"]).strip('[]')
+    except KeyError:
+        clinical = "Not specified"
+    for items in record.get("phenotypes", []):
+        try:
+            Gene = items['genes']
+        except KeyError:
+            Gene = 'Not specified'
+        try:
+            if items["risk_allele"] == record["minor_allele"]:
+                try:
+                    Trait = items['trait']
+                    if Trait.lower() not in Traitstring:
+                        Traitstring += f'|{Trait.lower()}|'
+                except KeyError:
+                    Traitstring = 'Not specified'
+            else:
+                try:
+                    AltTrait = items['trait']
+                    if AltTrait.lower() not in AltTraitsstring:
+                        AltTraitsstring = f'|{AltTrait.lower()}|'
+                except KeyError:
+                    AltTraitsstring = 'Not specified'
+        except KeyError:
+            continue
+    return [function, Gene, Traitstring, AltTraitsstring, clinical]
+
+
+def Popvalues(record, columns):
+    '''Parses the location, allele and population frequency data of one decoded pops=1 record
+            Input = the record and the Populationcolumns lookup
+            Output = (chromosome, position, minor allele, major allele, frequencies), frequencies holding
+            the minor and major allele frequency of every population in column order (nan if missing)'''
+    frequencies = [[] for population in columns]
+    chromosome = position = major = 'NA'
+    minor = record.get("minor_allele")
+    mappings = record.get("mappings", [])
+
+    # the first mapping is used, the ancestral allele only for single mapping indels
+    for items in mappings[:1]:
+        try:
+            chromosome = (items["location"].split(':'))[0]
+            position = (items["location"].split('-'))[1]
+        except KeyError:
+            chromosome = position = 'NA'
+        try:
+            if len(mappings) == 1 and len(items["allele_string"]) > 3:
+                major = items["ancestral_allele"]
+            else:
+                major = items["allele_string"].split('/')[0]
+                if major == minor:
+                    major = items["allele_string"].split('/')[1]
+        except (KeyError, IndexError):
+            major = 'NA'
+
+    for items in record.get('populations', []):
+        column = columns.get(items['population'])
+        if column is not None:
+            frequencies[column].append(items["frequency"])
+    values = []
+    for freqs in frequencies:
+        if freqs:
+            lowest = min(freqs)
+            values += [0 if lowest == 1 else lowest, max(freqs)]
+        else:
+            values += [math.nan, math.nan]
+    return Intern(chromosome), position, Intern('NA' if minor is None else minor), Intern(major), values
+
+
+def Genotypeclass(genotype, minorallele):
+    '''Classifies a phased (A|G), unphased (A/G), multi-allelic or haploid genotype by its number of minor alleles
+            Output = the index of the genotype class in GENOTYPES'''
+    alleles = genotype.replace('/', '|').split('|')
+    minors = alleles.count(minorallele)
+    if minors == 0:
+        # no minor allele, for multi-allelic sites this includes the other non minor genotypes
+        return 2
+    if minors == len(alleles):
+        return 1
+    return 0
+
+
+def Genotypevalues(record, columns):
+    '''Parses the genotype frequency data of one decoded population_genotypes=1 record
+            Input = the record and the Populationcolumns lookup
+            Output = list of the frequency of each genotype class (GENOTYPES) of every population in column order,
+            nan for the populations without genotypes'''
+    minorallele = record.get('minor_allele')
+    frequencies = [math.nan] * (len(GENOTYPES) * len(columns))
+    # each distinct genotype string is classified once per variant
+    classes = {}
+    for items in record.get('population_genotypes', []):
+        column = columns.get(items['population'])
+        if column is None:
+            continue
+        if math.isnan(frequencies[3 * column]):
+            frequencies[3 * column:3 * column + 3] = [0, 0, 0]
+        genotype = items['genotype']
+        genotypeclass = classes.get(genotype)
+        if genotypeclass is None:
+            genotypeclass = classes[genotype] = Genotypeclass(
+                genotype, minorallele)
+        frequencies[3 * column + genotypeclass] += items['frequency']
+    return frequencies
+
+
+# Columnar store of the data table
+###########################################################################################
+
+# Ensembl options filling the parts of a record
+PARTS = ['pops', 'phenotypes', 'population_genotypes']
+# Rows the columns of a record store start with, they double when full
+STORE_ROWS = 1024
+# Significant digits of the float32 frequencies given back as decimals (float32 holds 7)
+FREQUENCY_DIGITS = 6
+
+
+def Decimals(values, digits=FREQUENCY_DIGITS):
+    '''Returns float32 frequencies as float64 rounded to digits significant digits, which gives back the
+            decimals Ensembl sent without the float32 rounding noise (0.4237 rather than 0.42370000481605530)'''
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exponent = np.floor(np.log10(np.abs(values)))
+        scale = 10.0 ** (digits - 1 - np.where(np.isfinite(exponent), exponent, 0))
+    return np.round(values * scale) / scale
+
+
+class Recordstore():
+    '''Columnar store of the data table, merging the partial results of any fetcher (Ensembl, cache, VCF),
+    arriving in any order, into one row per rsID. Every field is a typed NumPy column grown by doubling:
+    int64 positions (-1 if unknown), float32 allele and genotype frequencies (nan if unknown) and object
+    columns of interned strings, rather than lists and dicts of Python objects per SNP.
+    A record is complete once the pops, phenotypes and population_genotypes parts are all in.'''
+
+    def __init__(self, populations=None):
+        self.populations = populations or POPULATIONS
+        self.columns = Populationcolumns(self.populations)
+        self.index = {}
+        self.size = 0
+        self.completed = set()
+        self.lock = threading.Lock()
+        self.grow(STORE_ROWS)
+
+    def layout(self):
+        '''Output = dict of column -> (dtype, shape of a row, value of a row without the part)'''
+        populations = len(self.populations)
+        return {'rsid': (object, (), None), 'number': (np.int64, (), 0), 'parts': (np.uint8, (), 0),
+                'chromosome': (object, (), None), 'position': (np.int64, (), -1),
+                'minor': (object, (), None), 'major': (object, (), None),
+                'frequencies': (np.float32, (2 * populations,), np.nan),
+                'phenotypes': (object, (5,), ''),
+                'genotypes': (np.float32, (len(GENOTYPES) * populations,), np.nan)}
+
+    def grow(self, rows):
+        '''Resizes the columns to rows records, the new rows are empty'''
+        for name, (dtype, shape, empty) in self.layout().items():
+            column = np.full((rows,) + shape, empty, dtype=dtype)
+            if self.size:
+                column[:self.size] = getattr(self, name)[:self.size]
+            setattr(self, name, column)
+
+    def parser(self, ext):
+        '''Returns the function turning a record of the ext endpoint into the parts of the table record it fills,
+                fetchers can run it on each record as it is decoded (see Ensemblbatch)'''
+        flags = Snpcache.Flags(ext)
+        columns = self.columns
+
+        def parse(value):
+            parts = {}
+            if 'pops' in flags:
+                parts['pops'] = Popvalues(value, columns)
+            if 'phenotypes' in flags:
+                parts['phenotypes'] = [Intern(text) for text in Phenrecord(value)]
+            if 'population_genotypes' in flags:
+                parts['population_genotypes'] = Genotypevalues(value, columns)
+            return parts
+        return parse
+
+    def merge(self, decoded, ext):
+        '''Upserts the records of a decoded response of the ext endpoint
+                Output = the rsIDs completed by it, sorted by their number'''
+        parse = self.parser(ext)
+        with Snptrace.span('parse', rows=len(decoded), parts=sorted(Snpcache.Flags(ext))):
+            parsed = {rsid: parse(value) for rsid, value in decoded.items()}
+        return self.add(parsed)
+
+    def add(self, parsed):
+        '''Writes records already turned into their parts by parser() into the columns
+                Output = the rsIDs completed by them, sorted by their number'''
+        completed = []
+        with self.lock:
+            for rsid, parts in parsed.items():
+                row = self.index.get(rsid)
+                if row is None:
+                    row = self.newrow(rsid)
+                if 'pops' in parts:
+                    chromosome, position, minor, major, frequencies = parts['pops']
+                    self.chromosome[row] = chromosome
+                    self.position[row] = int(position) if position.isdigit() else -1
+                    self.minor[row] = minor
+                    self.major[row] = major
+                    self.frequencies[row] = frequencies
+                if 'phenotypes' in parts:
+                    self.phenotypes[row] = parts['phenotypes']
+                if 'population_genotypes' in parts:
+                    self.genotypes[row] = parts['population_genotypes']
+                for part in parts:
+                    self.parts[row] |= 1 << PARTS.index(part)
+                if rsid not in self.completed and self.parts[row] == (1 << len(PARTS)) - 1:
+                    self.completed.add(rsid)
+                    completed.append(rsid)
+        return sorted(completed, key=lambda rsid: int(rsid.strip('rs')))
+
+    def newrow(self, rsid):
+        if self.size == len(self.rsid):
+            self.grow(2 * self.size)
+        row = self.index[rsid] = self.size
+        self.rsid[row] = rsid
+        self.number[row] = int(rsid.strip('rs'))
+        self.size += 1
+        return row
+
+    def select(self, rsids=None):
+        '''Returns the rows of rsids, by default of every record sorted by rsID'''
+        if rsids is None:
+            return np.argsort(self.number[:self.size], kind='stable')
+        return np.array([self.index[rsid] for rsid in rsids], dtype=np.int64)
+
+    def rows(self, rsids=None):
+        '''Returns the table rows of rsids, by default of every record sorted by rsID.
+                Missing values are None, or nan for the frequencies'''
+        with self.lock, Snptrace.span('table') as span:
+            rows = self.select(rsids)
+            span.set(rows=len(rows))
+            locations = zip(self.rsid[rows].tolist(), self.chromosome[rows].tolist(), self.position[rows].tolist(),
+                            self.minor[rows].tolist(), self.major[rows].tolist())
+            return [[rsid, chromosome, None if position < 0 else position, minor, major] +
+                    frequencies + phenotypes + genotypes
+                    for (rsid, chromosome, position, minor, major), frequencies, phenotypes, genotypes
+                    in zip(locations, Decimals(self.frequencies[rows]).tolist(), self.phenotypes[rows].tolist(),
+                           Decimals(self.genotypes[rows]).tolist())]
+
+    def table(self, rsids=None):
+        '''Returns the data table of rsids (by default every record sorted by rsID) as one array per column,
+                in the order of Columns(populations)'''
+        with self.lock:
+            rows = self.select(rsids)
+            return ([self.rsid[rows], self.chromosome[rows], self.position[rows], self.minor[rows],
+                     self.major[rows]] + list(self.frequencies[rows].T) + list(self.phenotypes[rows].T) +
+                    list(self.genotypes[rows].T))
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, rsid):
+        return rsid in self.index
+
+
+def Getdata(UIDlist, batch_size=None, inflight=None, combined=True, callback=None, job=None, checkpoint=None):
+    '''Retrieves all the table data for the UIDs (see Getstore)
+            Output = the table rows sorted by rsID'''
+    return Getstore(UIDlist, batch_size, inflight, combined, callback, job, checkpoint).rows()
+
+
+def Getstore(UIDlist, batch_size=None, inflight=None, combined=True, callback=None, job=None, checkpoint=None):
+    '''Retrieves all the table data for the UIDs into a Recordstore, with one combined request per batch
+            or with separate pops/phenotypes/population_genotypes requests.
+            callback (optional) is called with the rows of every batch of SNPs as they complete.
+            job (optional Snpjob.Job) reports the progress after every batch and raises Snpjob.Cancelled once cancelled.
+            checkpoint (optional Snpjob.Checkpoint) saves every finished batch, the batches it has are not requested again.
+            With a VCF source the SNPs found locally are only asked from Ensembl for their phenotypes.'''
+    if combined:
+        exts = ["/variation/homo_sapiens?pops=1&phenotypes=1&population_genotypes=1"]
+    else:
+        exts = [f"/variation/homo_sapiens?{part}=1" for part in PARTS]
+    store = Recordstore()
+    requests = [(UIDlist, ext) for ext in exts]
+    if job:
+        job.add(variants=len(UIDlist))
+    if VCF:
+        for decoded in VCF.stream(UIDlist, batch_size):
+            if job:
+                job.check()
+            store.merge(decoded, VCF.ext)
+        found = [f"rs{str(uid).lower().strip('rs')}" in store for uid in UIDlist]
+        local = [uid for uid, infile in zip(UIDlist, found) if infile]
+        remote = [uid for uid, infile in zip(UIDlist, found) if not infile]
+        requests = [(local, "/variation/homo_sapiens?phenotypes=1")] + \
+            [(remote, ext) for ext in exts]
+    for uids, ext in requests:
+        if not uids:
+            continue
+        for parsed in Ensemblstream(uids, ext, batch_size, inflight, job, checkpoint, store.parser(ext)):
+            completed = store.add(parsed)
+            if job:
+                job.advance(variants=len(completed))
+                job.report()
+            if callback and completed:
+                callback(store.rows(completed))
+    return store
+
+
+def Celltext(value):
+    '''Returns the text of a table value in the GUI and the csv files'''
+    if value is None:
+        return 'NA'
+    if isinstance(value, (float, np.floating)):
+        if math.isnan(value):
+            return 'NA'
+        # the shortest text of a float32 is the decimal it was made from
+        text = str(float(str(value)) if isinstance(value, np.float32) else value)
+        return text[:-2] if text.endswith('.0') else text
+    return value if type(value) is str else str(value)
+
+
+# Command line entry point
+###########################################################################################
+
+def Readlist(values, path):
+    '''Joins the values given on the command line with the ones of a file (one per line)'''
+    items = list(values or [])
+    if path:
+        with open(path) as handle:
+            items += [line.strip() for line in handle if line.strip()]
+    return items
+
+
+def Output(store, path):
+    '''Writes the table of a Recordstore to the csv, parquet or feather file at path or as csv to stdout,
+            the csv files are the ones the GUI saves'''
+    import Snptable
+    frame = Snptable.Storeframe(store)
+    if path:
+        Snptable.Export(frame, path)
+        return
+    with Snptrace.span('export', rows=len(frame)):
+        sys.stdout.flush()
+        Snptable.Writecsv(frame, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Retrieve SNP population data from dbSNP and Ensembl without the GUI.')
+    parser.add_argument('queries', nargs='*',
+                        help="genes (e.g. 'NAT2'), chromosomes (e.g. '8') or regions (e.g. '8:1-50000')")
+    parser.add_argument('-f', '--queries-file',
+                        help='file with one gene/chromosome/region per line')
+    parser.add_argument('-r', '--rsids', nargs='*',
+                        help='rsIDs to retrieve data for (with or without the rs prefix)')
+    parser.add_argument('--rsids-file', help='file with one rsID per line')
+    parser.add_argument('--retstart', type=int, default=0,
+                        help='sequential index of the first SNP retrieved per query')
+    parser.add_argument('--retmax', type=int, default=100,
+                        help='the number of SNPs retrieved per query')
+    parser.add_argument('--all', action='store_true',
+                        help='retrieve all the SNPs of each query from retstart on, ignoring retmax')
+    parser.add_argument('--clinsignificance', default='No Filtering',
+                        help="clinical significance SNP filter (e.g. 'drug response')")
+    parser.add_argument('--common', action='store_true',
+                        help='search only for common variants (0.01 <= MAF <= 1)')
+    parser.add_argument('--populations', nargs='*', default=['1000G'],
+                        help=f'populations shown as columns: population sets ({", ".join(POPULATION_SETS)}) '
+                        'and/or Ensembl population names (e.g. 1000GENOMES:phase_3:TSI)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'rsIDs per Ensembl request (at most {BATCH_SIZE})')
+    parser.add_argument('--inflight', type=int, default=MAX_INFLIGHT,
+                        help='number of Ensembl requests running at the same time')
+    parser.add_argument('--separate-requests', action='store_true',
+                        help='fetch the population, phenotype and genotype data with three requests per batch')
+    parser.add_argument('--async', dest='pipeline', action='store_true',
+                        help='run the searches and Ensembl batches of all the queries concurrently with asyncio (needs aiohttp)')
+    parser.add_argument('--esearch-concurrency', type=int, default=3,
+                        help='esearch requests running at the same time with --async')
+    parser.add_argument('--cache', default=Snpcache.DEFAULT_PATH,
+                        help='sqlite file caching the Ensembl variation records')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not read or write the variant cache')
+    parser.add_argument('--cache-ttl', type=float, default=Snpcache.DEFAULT_TTL / 86400,
+                        help='days after which cached records are fetched again')
+    parser.add_argument('--offline', action='store_true',
+                        help='serve the Ensembl data only from the cache')
+    parser.add_argument('--index',
+                        help='gene/region index built by Snpindex.py to search the SNPs offline instead of with the NCBI esearch')
+    parser.add_argument('--vcf', nargs='*',
+                        help='bgzipped, tabix indexed 1000 Genomes VCFs (or folders of them) to compute the '
+                        'population and genotype frequencies from instead of Ensembl (needs pysam)')
+    parser.add_argument('--panel', help='1000 Genomes sample panel file of the --vcf samples')
+    parser.add_argument('--groups',
+                        help='file of custom population groups computed from the --vcf samples, one per line: '
+                        'the group name followed by its samples and/or 1000 Genomes populations')
+    parser.add_argument('--checkpoint',
+                        help='folder saving the finished esearch pages and Ensembl batches as they arrive; '
+                        'running the same command again resumes the job from it')
+    parser.add_argument('--trace',
+                        help='json file to write the timing of every stage to (Chrome trace/Perfetto format, '
+                        f'also set by {Snptrace.ENV}), a summary is printed at the end')
+    parser.add_argument('-o', '--output',
+                        help='csv, parquet or feather file to write the table to (default: csv to stdout)')
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        Snptrace.enable(args.trace)
+    global CACHE, POPULATIONS, VCF, INDEX
+    POPULATIONS = Populations(args.populations)
+    if args.index:
+        import Snpindex
+        INDEX = Snpindex.Variantindex.load(args.index)
+    if args.vcf:
+        if not args.panel:
+            parser.error('--vcf needs the --panel sample file')
+        import Snpvcf
+        VCF = Snpvcf.Vcfsource(args.vcf, args.panel)
+        if args.groups:
+            POPULATIONS = POPULATIONS + VCF.addgroups(Snpvcf.Readgroups(args.groups))
+    elif args.groups:
+        parser.error('--groups needs the --vcf genotypes')
+    if not args.no_cache:
+        CACHE = Snpcache.Variantcache(args.cache, Ensemblrelease,
+                                      ttl=args.cache_ttl * 86400, offline=args.offline)
+    elif args.offline:
+        parser.error('--offline needs the cache')
+    checkpoint = None
+    if args.checkpoint:
+        if args.pipeline:
+            parser.error('--checkpoint is not supported with --async')
+        settings = {'queries': Readlist(args.queries, args.queries_file), 'retstart': args.retstart,
+                    'retmax': args.retmax, 'all': args.all, 'clinsignificance': args.clinsignificance,
+                    'common': args.common}
+        try:
+            checkpoint = Snpjob.Checkpoint(args.checkpoint, settings)
+        except ValueError as error:
+            parser.error(str(error))
+        saved = sum(len(batches) for batches in checkpoint.batches.values())
+        if saved:
+            print(f'{args.checkpoint}: resuming after {saved} Ensembl batches', file=sys.stderr)
+
+    queries = Readlist(args.queries, args.queries_file)
+    UIDlist = [int(str(rs).lower().strip('rs'))
+               for rs in Readlist(args.rsids, args.rsids_file)]
+    if not queries and not UIDlist:
+        parser.error('no genes/regions or rsIDs given')
+    if args.pipeline:
+        import Snpasync
+        store = Snpasync.Getstore(queries, UIDlist, lambda text: print(text, file=sys.stderr),
+                                  clinsignificance=args.clinsignificance, common=args.common,
+                                  retstart=args.retstart, retmax=args.retmax, fetch_all=args.all,
+                                  batch_size=args.batch_size, esearch_concurrency=args.esearch_concurrency,
+                                  ensembl_concurrency=args.inflight)
+        Output(store, args.output)
+        return 0
+
+    for query in queries:
+        if args.all:
+            found, count = all_SNV(query, args.clinsignificance, args.common, args.retstart,
+                                   lambda page: print(f'{query}: +{len(page[0])}/{page[1]}', file=sys.stderr),
+                                   checkpoint=checkpoint)
+        else:
+            found, count = available_SNV(args.retstart, args.retmax, query,
+                                         args.clinsignificance, args.common, checkpoint)
+        print(f'{query}: SNPs: {len(found)}/{count}', file=sys.stderr)
+        UIDlist += found
+    UIDlist = sorted(set(UIDlist))
+
+    store = Getstore(UIDlist, args.batch_size, args.inflight,
+                     not args.separate_requests, checkpoint=checkpoint) if UIDlist else Recordstore()
+    Output(store, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,24 @@
+import os
 import sys
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import QDir, pyqtSlot, pyqtSignal
-import requests
-import pandas as pd
-import json
 import traceback
+import Snpcore
+import Snpcache
+import Snpjob
+import Snptable
+import Snptrace
+
+
+# Constants
+###########################################################################################
+# Rows of the UID list around the visible ones whose summaries are prefetched
+PREFETCH_ROWS = 50
+# Milliseconds the list has to stay still (scrolling, pages arriving) before prefetching
+PREFETCH_DELAY = 200
+# Thread pool priorities: prefetching waits for the other workers, a clicked SNP goes first
+PREFETCH_PRIORITY = -1
+CLICK_PRIORITY = 1
 
 
 # Worker class signal handler
@@ -16,6 +30,9 @@ class WorkerSignals(QtCore.QObject):
     finished = pyqtSignal()
     result = pyqtSignal(object)
     error = pyqtSignal(tuple)
+    progress = pyqtSignal(object)
+    status = pyqtSignal(dict)
+    cancelled = pyqtSignal()
 
 # Workers class/Thread
 ############################################################################################
@@ -46,6 +63,8 @@ class Worker(QtCore.QRunnable):
             result = self.function(
                 *self.args, **self.kwargs
             )
+        except Snpjob.Cancelled:
+            self.signals.cancelled.emit()
         except:
             traceback.print_exc()
             exctype, value = sys.exc_info()[:2]
@@ -57,16 +76,241 @@ class Worker(QtCore.QRunnable):
             self.signals.finished.emit()  # Done
 
 
+class Jobworker(Worker):
+    '''Worker running a cancellable Snpjob.Job: the function gets the job as its job keyword,
+    the job status is emitted by the status signal and cancel() stops the function'''
+
+    def __init__(self, function, *args, **kwargs):
+        super(Jobworker, self).__init__(function, *args, **kwargs)
+        self.job = Snpjob.Job(self.signals.status.emit)
+        self.kwargs['job'] = self.job
+
+    def cancel(self):
+        self.job.cancel()
+
+
+# Table model class
+############################################################################################
+
+
+class Variantmodel(QtCore.QAbstractTableModel):
+    '''Table model over the columnar store of the data table, only the visible cells are turned into text.
+    The rows of the batches completed while the data is retrieved are kept as they come below the frame,
+    they only become part of it once frame is read'''
+
+    def __init__(self, columns, parent=None):
+        super(Variantmodel, self).__init__(parent)
+        self.columns = columns
+        self.setframe(Snptable.Frame([], columns))
+
+    def setframe(self, frame):
+        '''Replaces the data of the table'''
+        with Snptrace.span('render', rows=len(frame)):
+            self.beginResetModel()
+            self.setbase(frame)
+            self.endResetModel()
+
+    def setbase(self, frame):
+        self.base = frame
+        self.values = [frame[column].to_numpy() for column in frame.columns]
+        self.appended = []
+
+    @property
+    def frame(self):
+        '''The data of the table as a frame, the appended rows are added to it in one step'''
+        if self.appended:
+            self.setbase(Snptable.Append(self.base, self.appended))
+        return self.base
+
+    def clear(self):
+        self.setframe(Snptable.Frame([], self.columns))
+
+    def appendrows(self, rows):
+        '''Shows the rows of a completed batch below the current ones'''
+        if not rows:
+            return
+        start = self.rowCount()
+        with Snptrace.span('render', rows=len(rows)):
+            self.beginInsertRows(QtCore.QModelIndex(), start, start + len(rows) - 1)
+            self.appended.extend(rows)
+            self.endInsertRows()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.base) + len(self.appended)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+        row = index.row()
+        if row >= len(self.base):
+            return Snptable.Celltext(self.appended[row - len(self.base)][index.column()])
+        return Snptable.Celltext(self.values[index.column()][row])
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole:
+            return None
+        if orientation == QtCore.Qt.Horizontal:
+            return self.columns[section]
+        return str(section + 1)
+
+
+# Summary prefetch class
+############################################################################################
+
+
+class Summaryprefetch(QtCore.QObject):
+    '''In memory summaries of the SNPs of the UID list. The summaries of the rows shown and their neighbours
+    are fetched in the background, one batched Ensembl POST request at a time and behind the other workers,
+    so most clicks are answered from memory. A click on a SNP not fetched yet sends its own request, which
+    supersedes (cancels) the request of the previous click. ready is emitted with the summary of the SNP
+    clicked last once it arrives.'''
+
+    ready = pyqtSignal(str)
+
+    def __init__(self, threadpool, parent=None):
+        super(Summaryprefetch, self).__init__(parent)
+        self.threadpool = threadpool
+        self.summaries = {}
+        self.wanted = []
+        self.worker = None
+        self.clickworker = None
+        self.current = None
+
+    def prefetch(self, uids):
+        '''Replaces the UIDs waiting to be prefetched, uids are in order of priority'''
+        self.wanted = [uid for uid in uids if uid not in self.summaries]
+        self.next()
+
+    def next(self):
+        '''Starts the prefetch of the next batch unless one is running'''
+        if self.worker is not None or not self.wanted:
+            return
+        batch, self.wanted = self.wanted[:Snpcore.BATCH_SIZE], self.wanted[Snpcore.BATCH_SIZE:]
+        worker = self.worker = Jobworker(Snpcore.Summaries, batch)
+        worker.signals.result.connect(self.add)
+        worker.signals.finished.connect(lambda: self.done(worker))
+        self.threadpool.start(worker, PREFETCH_PRIORITY)
+
+    def done(self, worker):
+        if self.worker is worker:
+            self.worker = None
+            self.next()
+
+    def add(self, summaries):
+        self.summaries.update(summaries)
+        if self.current in summaries:
+            self.ready.emit(summaries[self.current])
+
+    def get(self, uid):
+        '''Returns the summary of the clicked uid if it is in memory, otherwise None after requesting it'''
+        self.current = uid
+        if uid in self.summaries:
+            return self.summaries[uid]
+        if self.clickworker is not None:
+            self.clickworker.cancel()
+        worker = self.clickworker = Jobworker(Snpcore.infosum, uid)
+        worker.signals.result.connect(lambda summary: self.add({uid: summary}))
+        self.threadpool.start(worker, CLICK_PRIORITY)
+        return None
+
+    def clear(self):
+        '''Forgets the summaries and stops the requests'''
+        for worker in (self.worker, self.clickworker):
+            if worker is not None:
+                worker.cancel()
+        self.summaries = {}
+        self.wanted = []
+        self.worker = self.clickworker = self.current = None
+
+
+# Selection model class
+############################################################################################
+
+
+class Selectionmodel(QtCore.QAbstractListModel):
+    '''List model of the selected UIDs, an insertion ordered set: membership checks don't scan the list
+    and UIDs are added in bulk with a single insert notification'''
+
+    def __init__(self, parent=None):
+        super(Selectionmodel, self).__init__(parent)
+        self.selected = {}
+        self.order = []
+
+    def add(self, uids):
+        '''Adds the UIDs not selected yet, in order'''
+        new = []
+        for uid in uids:
+            if uid not in self.selected:
+                self.selected[uid] = None
+                new.append(uid)
+        if not new:
+            return
+        start = len(self.order)
+        self.beginInsertRows(QtCore.QModelIndex(), start, start + len(new) - 1)
+        self.order.extend(new)
+        self.endInsertRows()
+
+    def remove(self, row):
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        del self.selected[self.order.pop(row)]
+        self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.selected = {}
+        self.order = []
+        self.endResetModel()
+
+    def uids(self):
+        return list(self.order)
+
+    def __contains__(self, uid):
+        return uid in self.selected
+
+    def __len__(self):
+        return len(self.order)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+        return self.order[index.row()]
+
+
 class Ui_MainWindow(QtWidgets.QMainWindow):
 
     # Worker thread for the UID summary request
     #################################################
 
     def UIDclicked(self, item):
-        '''connects the thread to the infosum function'''
-        worker = Worker(self.infosum, item)
-        worker.signals.started.connect(self.infosearch)
-        self.threadpool.start(worker)
+        '''Shows the summary of the SNP clicked, from memory if it was prefetched'''
+        summary = self.Summaryprefetch.get(item.text())
+        if summary is None:
+            self.infosearch()
+        else:
+            self.label_8.setText(summary)
+
+    def visible_UIDs(self):
+        '''Returns the UIDs of the rows shown in the UID list followed by the PREFETCH_ROWS rows
+                above and below them, nearest first'''
+        count = self.UIDlist.count()
+        if not count:
+            return []
+        first = max(self.UIDlist.indexAt(QtCore.QPoint(0, 0)).row(), 0)
+        last = self.UIDlist.indexAt(QtCore.QPoint(0, self.UIDlist.viewport().height() - 1)).row()
+        last = count - 1 if last < 0 else last
+        rows = list(range(first, last + 1))
+        for n in range(1, PREFETCH_ROWS + 1):
+            rows += [row for row in (last + n, first - n) if 0 <= row < count]
+        return [self.UIDlist.item(row).text() for row in rows]
+
+    def prefetch_visible(self):
+        self.Summaryprefetch.prefetch(self.visible_UIDs())
 
         # Worker thread for the UID list request
         ##############################################################################################################################
@@ -74,23 +318,45 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
     def RetrieveSNPs_clicked(self):
         '''When the Retrieve UIDs button is clicked empty the SNP list and load a new one using the available_SNV function'''
         self.UIDlist.clear()
-        if self.Retmax.value() == 0:
+        if self.Fetchall.isChecked():
+            worker = Jobworker(Snpcore.all_SNV,
+                               self.genename.text(), self.clinsignificance.currentText(),
+                               self.commonfill.isChecked(), self.Retstart.value())
+            worker.kwargs['callback'] = worker.signals.progress.emit
+            worker.signals.started.connect(self.Ui_Load_UIDs_off)
+            worker.signals.progress.connect(self.UIdpagefunc)
+            worker.signals.status.connect(
+                lambda status: self.process.setText('Retrieving SNPs from DbSNP: ' + Snpjob.Statustext(status)))
+            worker.signals.finished.connect(self.Ui_Load_UIDs_on)
+            self.startjob(worker)
+        elif self.Retmax.value() == 0:
             msg = QtWidgets.QMessageBox.information(self, ' ', 'Retmax value cant be 0,\nplease enter the number of results you want.',
                                                     QtWidgets.QMessageBox.Yes)
 
         else:
-            worker = Worker(self.available_SNV,
-                            self.Retstart.value(), self.Retmax.value(), self.genename.text(), self.clinsignificance.currentText())
+            worker = Worker(Snpcore.available_SNV,
+                            self.Retstart.value(), self.Retmax.value(), self.genename.text(), self.clinsignificance.currentText(),
+                            self.commonfill.isChecked())
             worker.signals.started.connect(self.Ui_Load_UIDs_off)
             worker.signals.result.connect(self.UIdlistfunc)
             worker.signals.finished.connect(self.Ui_Load_UIDs_on)
             self.threadpool.start(worker)
 
-    def UIdlistfunc(self, Uidlist):
+    def UIdlistfunc(self, result):
         '''Updates the UID list widget'''
+        Uidlist, count = result
+        self.label.setText(f"SNPs: {len(Uidlist)}/{count}")
         strlist = [str(x) for x in Uidlist]
         self.UIDlist.clear()
         self.UIDlist.addItems(tuple(strlist))
+        self.Prefetchtimer.start()
+
+    def UIdpagefunc(self, page):
+        '''Appends a page of UIDs to the UID list widget while all the SNPs are retrieved'''
+        Uidpage, count = page
+        self.UIDlist.addItems(tuple(str(x) for x in Uidpage))
+        self.label.setText(f"SNPs: {self.UIDlist.count()}/{count}")
+        self.Prefetchtimer.start()
 
 
 # Worker thread for the retrieve the frequencies request
@@ -99,165 +365,39 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
 
     def Get_Data_Clicked(self):
         '''Retrieves data for the selected rsIDs'''
-        if self.SelectedUID.count() == 0:
+        if not len(self.Selectionmodel):
             msg = QtWidgets.QMessageBox.warning(self, 'ERROR', 'Zero UIDs selected',
                                                 QtWidgets.QMessageBox.Ok)
         else:
-            self.DataTable.model().removeRows(0, self.DataTable.rowCount())
-            worker1 = Worker(self.Popfinder, self.Selected_UID_list())
-            worker2 = Worker(self.Phenfinder, self.Selected_UID_list())
-            worker3 = Worker(self.Genotypefinder, self.Selected_UID_list())
-            worker2.signals.started.connect(self.Ui_Get_Freqs_off)
-            worker3.signals.started.connect(self.Ui_Get_Freqs_off)
-            worker1.signals.started.connect(self.Ui_Get_Freqs_off)
-            worker1.signals.result.connect(self.Tablemaker)
-            worker2.signals.result.connect(self.Tablemaker2)
-            worker3.signals.result.connect(self.Tablemaker3)
-            worker1.signals.finished.connect(self.Ui_Get_Freqs_on)
-            self.threadpool.start(worker1)
-            self.threadpool.start(worker2)
-            self.threadpool.start(worker3)
-
-    def Tablemaker(self, alistoflists):
-        '''Passes the SNP data into the Table'''
-        self.DataTable.setRowCount(len(alistoflists[0]))
-        for row in range(len(alistoflists[0])):
-            self.DataTable.setItem(
-                row, 0, QtWidgets.QTableWidgetItem(alistoflists[0][row]))
-            self.DataTable.setItem(
-                row, 1, QtWidgets.QTableWidgetItem(alistoflists[1][row]))
-            self.DataTable.setItem(
-                row, 2, QtWidgets.QTableWidgetItem(alistoflists[2][row]))
-            self.DataTable.setItem(
-                row, 3, QtWidgets.QTableWidgetItem(alistoflists[3][row]))
-            self.DataTable.setItem(
-                row, 4, QtWidgets.QTableWidgetItem(alistoflists[4][row]))
-            try:
-                self.DataTable.setItem(
-                    row, 5, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:ALL_minor'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 5, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 6, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:ALL_major'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 6, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 7, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:AFR_minor'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 7, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 8, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:AFR_major'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 8, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 9, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:EUR_minor'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 9, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 10, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:EUR_major'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 10, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 11, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:AMR_minor'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 11, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 12, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:AMR_major'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 12, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 13, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:EAS_minor'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 13, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 14, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:EAS_major'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 14, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 15, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:SAS_minor'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 15, QtWidgets.QTableWidgetItem('NA'))
-            try:
-                self.DataTable.setItem(
-                    row, 16, QtWidgets.QTableWidgetItem(str(alistoflists[5][row]['1000GENOMES:phase_3:SAS_major'])))
-            except KeyError:
-                self.DataTable.setItem(
-                    row, 16, QtWidgets.QTableWidgetItem('NA'))
-
-    def Tablemaker2(self, alistoflists):
-        self.DataTable.setRowCount(len(alistoflists[0]))
-        for row in range(len(alistoflists[0])):
-            self.DataTable.setItem(
-                row, 17, QtWidgets.QTableWidgetItem(alistoflists[0][row]))
-            self.DataTable.setItem(
-                row, 18, QtWidgets.QTableWidgetItem(alistoflists[1][row]))
-            self.DataTable.setItem(
-                row, 19, QtWidgets.QTableWidgetItem(alistoflists[2][row]))
-            self.DataTable.setItem(
-                row, 20, QtWidgets.QTableWidgetItem(alistoflists[3][row]))
-            self.DataTable.setItem(
-                row, 21, QtWidgets.QTableWidgetItem(alistoflists[4][row]))
-
-    def Tablemaker3(self, alist):
-        self.DataTable.setRowCount(len(alist))
-        for row in range(len(alist)):
-            self.DataTable.setItem(
-                row, 22, QtWidgets.QTableWidgetItem(str(alist[row]['heterozygousALL'])))
-            self.DataTable.setItem(
-                row, 23, QtWidgets.QTableWidgetItem(str(alist[row]['minorhomozygousALL'])))
-            self.DataTable.setItem(
-                row, 24, QtWidgets.QTableWidgetItem(str(alist[row]['majorhomozygousALL'])))
-            self.DataTable.setItem(
-                row, 25, QtWidgets.QTableWidgetItem(str(alist[row]['heterozygousAFR'])))
-            self.DataTable.setItem(
-                row, 26, QtWidgets.QTableWidgetItem(str(alist[row]['minorhomozygousAFR'])))
-            self.DataTable.setItem(
-                row, 27, QtWidgets.QTableWidgetItem(str(alist[row]['majorhomozygousAFR'])))
-            self.DataTable.setItem(
-                row, 28, QtWidgets.QTableWidgetItem(str(alist[row]['heterozygousEUR'])))
-            self.DataTable.setItem(
-                row, 29, QtWidgets.QTableWidgetItem(str(alist[row]['minorhomozygousEUR'])))
-            self.DataTable.setItem(
-                row, 30, QtWidgets.QTableWidgetItem(str(alist[row]['majorhomozygousEUR'])))
-            self.DataTable.setItem(
-                row, 31, QtWidgets.QTableWidgetItem(str(alist[row]['heterozygousAMR'])))
-            self.DataTable.setItem(
-                row, 32, QtWidgets.QTableWidgetItem(str(alist[row]['minorhomozygousAMR'])))
-            self.DataTable.setItem(
-                row, 33, QtWidgets.QTableWidgetItem(str(alist[row]['majorhomozygousAMR'])))
-            self.DataTable.setItem(
-                row, 34, QtWidgets.QTableWidgetItem(str(alist[row]['heterozygousEAS'])))
-            self.DataTable.setItem(
-                row, 35, QtWidgets.QTableWidgetItem(str(alist[row]['minorhomozygousEAS'])))
-            self.DataTable.setItem(
-                row, 36, QtWidgets.QTableWidgetItem(str(alist[row]['majorhomozygousEAS'])))
-            self.DataTable.setItem(
-                row, 37, QtWidgets.QTableWidgetItem(str(alist[row]['heterozygousSAS'])))
-            self.DataTable.setItem(
-                row, 38, QtWidgets.QTableWidgetItem(str(alist[row]['minorhomozygousSAS'])))
-            self.DataTable.setItem(
-                row, 39, QtWidgets.QTableWidgetItem(str(alist[row]['majorhomozygousSAS'])))
+            self.Tablemodel.clear()
+            worker = Jobworker(Snptable.Getframe, self.Selected_UID_list())
+            # completed SNPs are shown batch by batch, the sorted table replaces them at the end
+            # (a cancelled job keeps the SNPs completed so far)
+            worker.kwargs['callback'] = worker.signals.progress.emit
+            worker.signals.started.connect(self.Ui_Get_Freqs_off)
+            worker.signals.progress.connect(self.Tablemodel.appendrows)
+            worker.signals.status.connect(
+                lambda status: self.process.setText('Retrieving SNP data: ' + Snpjob.Statustext(status)))
+            worker.signals.result.connect(self.Tablemodel.setframe)
+            worker.signals.finished.connect(self.Ui_Get_Freqs_on)
+            self.startjob(worker)
+
+    def startjob(self, worker):
+        '''Starts a Jobworker, the Cancel button stops it until it finishes'''
+        self.jobs.append(worker)
+        worker.signals.finished.connect(lambda: self.endjob(worker))
+        self.Cancelbut.setEnabled(True)
+        self.threadpool.start(worker)
+
+    def endjob(self, worker):
+        self.jobs.remove(worker)
+        self.Cancelbut.setEnabled(bool(self.jobs))
+
+    def cancel_clicked(self):
+        '''Cancels the running jobs, their requests in flight are aborted'''
+        for worker in self.jobs:
+            worker.cancel()
+        self.process.setText('Cancelling...')
 
         # Ui update while a thread starts/finishes
         #########################################################################
@@ -272,6 +412,7 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         self.Retstart.setEnabled(False)
         self.UIDlist.setEnabled(False)
         self.RetrieveUIDs.setEnabled(False)
+        self.Fetchall.setEnabled(False)
         self.Savebut.setEnabled(False)
         self.Clearbut.setEnabled(False)
         self.genename.setEnabled(False)
@@ -286,6 +427,7 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         self.commonfill.setEnabled(True)
         self.commonfill.setChecked(False)
         self.RetrieveUIDs.setEnabled(True)
+        self.Fetchall.setEnabled(True)
         self.SelectAll.setEnabled(True)
         self.Savebut.setEnabled(True)
         self.Clearbut.setEnabled(True)
@@ -312,45 +454,31 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
     # Function section
     ###################################################################################################################
 
-    # Function to save data from the table as a csv
+    # Function to save data from the table as a csv/parquet/feather file
     ########################################################################################################################################################
 
     def save_clicked(self):
-        columnHeaders = []
-
-        # create column header list
-        for j in range(self.DataTable.model().columnCount()):
-            columnHeaders.append(self.DataTable.horizontalHeaderItem(j).text())
-
-        df = pd.DataFrame(columns=columnHeaders)
-
-        # create dataframe object recordset
-        for row in range(self.DataTable.rowCount()):
-            for col in range(self.DataTable.columnCount()):
-                df.at[row, columnHeaders[col]] = self.DataTable.item(
-                    row, col).text()
+        df = self.Tablemodel.frame
 
         text, ok = QtWidgets.QInputDialog.getText(
-            self, 'Saving csv', 'File Name:')
+            self, 'Saving csv', 'File Name (.csv, .parquet or .feather):')
 
         if ok and text != '':
             textls = text.split('.')
             if len(textls) == 2:
                 if textls[0].isalnum() == True and textls[1].isalnum() == True:
-                    if textls[1] == 'csv':
-                        df.to_csv(f'{text[0]}.{textls[1]}', index=False)
-                        msg = QtWidgets.QMessageBox.information(self, ' ', 'File Saved.',
-                                                                QtWidgets.QMessageBox.Ok)
+                    if textls[1] in Snptable.FORMATS:
+                        Snptable.Export(df, f'{textls[0]}.{textls[1]}')
                     else:
-                        df.to_csv(f'{textls[0]}.csv', index=False)
-                        msg = QtWidgets.QMessageBox.information(self, ' ', 'File Saved.',
-                                                                QtWidgets.QMessageBox.Ok)
+                        Snptable.Export(df, f'{textls[0]}.csv')
+                    msg = QtWidgets.QMessageBox.information(self, ' ', 'File Saved.',
+                                                            QtWidgets.QMessageBox.Ok)
                 else:
                     msg = QtWidgets.QMessageBox.warning(self, 'ERROR!', 'Only use alphanumeric characters\nfor the file name.',
                                                         QtWidgets.QMessageBox.Ok)
 
             elif len(textls) == 1 and text.isalnum() == True:
-                df.to_csv(f'{text}.csv', index=False)
+                Snptable.Export(df, f'{text}.csv')
                 msg = QtWidgets.QMessageBox.information(self, ' ', 'File Saved.',
                                                         QtWidgets.QMessageBox.Ok)
             else:
@@ -361,444 +489,19 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
             msg = QtWidgets.QMessageBox.warning(self, 'ERROR', 'A file name cant be blank',
                                                 QtWidgets.QMessageBox.Ok)
 
- # Functions for searching and fetching SNP data from dbSNP and Ensemble
-            ###############################################################################################################################################################################################
-
-    def available_SNV(self, retstart, retmax, gene, clinsignificance):
-        UIDlist = []
-        '''Input = from wich row in the database should the results begin, the number of results you want
-                Output = the list of available UIDs based on the inputs'''
-        if clinsignificance == 'No Filtering':
-            if gene == '(optional)' and self.commonfill.isChecked() == True:
-                r = requests.get(
-                    f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+AND+00000.0100:+00001.0000[GLOBAL_MAF]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-            elif gene == '(optional)' and self.commonfill.isChecked() == False:
-                r = requests.get(
-                    f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+NOT+00000.0000[Global Minor Allele Frequency]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-            elif gene != '(optional)' and self.commonfill.isChecked() == True:
-                if gene.isnumeric() or (gene == 'Y' or gene == 'X'):
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+AND+00000.0100:+00001.0000[GLOBAL_MAF]+AND+{gene}[Chromosome]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-                elif (':' not in gene) and (not gene.isnumeric()) and (not(gene == 'Y' or gene == 'X')):
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+AND+00000.0100:+00001.0000[GLOBAL_MAF]+AND+{gene}[Gene Name]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-                elif (':' in gene) and ('-' in gene):
-                    x = gene.split(':')
-                    y = x[1].split('-')
-                    chrom = x[0]
-                    bpstart = y[0]
-                    bpend = y[1]
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+AND+00000.0100:+00001.0000[GLOBAL_MAF]+AND+({chrom}[Chromosome]+AND+({bpstart}[CHRPOS]+:+{bpend}[CHRPOS]))&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-
-            elif gene != '(optional)' and self.commonfill.isChecked() == False:
-                if gene.isnumeric() or (gene == 'Y' or gene == 'X'):
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+NOT+00000.0000[Global Minor Allele Frequency]+AND+{gene}[Chromosome]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-                elif (':' not in gene) and (not gene.isnumeric()) and (not(gene == 'Y' or gene == 'X')):
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+NOT+00000.0000[Global Minor Allele Frequency]+AND+{gene}[Gene Name]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-                elif (':' in gene) and ('-' in gene):
-                    x = gene.split(':')
-                    y = x[1].split('-')
-                    chrom = x[0]
-                    bpstart = y[0]
-                    bpend = y[1]
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+NOT+00000.0000[Global Minor Allele Frequency]+AND+{chrom}[Chromosome]+AND+{bpstart}[CHRPOS]+:+{bpend}[CHRPOS]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-            data = json.loads(r.content)
-            strlist = (data['esearchresult']['idlist'])
-            numlist = [int(x) for x in strlist]
-            UIDlist = sorted(numlist)
-            self.label.setText(
-                f"SNPs: {len(UIDlist)}/{data['esearchresult']['count']}")
-
-        else:
-            clinsignificance1 = str(clinsignificance).replace(' ', '+')
-            if gene == '(optional)' and self.commonfill.isChecked() == True:
-                r = requests.get(
-                    f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+AND+00000.0100:+00001.0000[GLOBAL_MAF]+AND+{clinsignificance1}[Clinical Significance]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-            elif gene == '(optional)' and self.commonfill.isChecked() == False:
-                r = requests.get(
-                    f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+NOT+00000.0000[Global Minor Allele Frequency]+AND+{clinsignificance1}[Clinical Significance]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-            elif gene != '(optional)' and self.commonfill.isChecked() == True:
-                if gene.isnumeric() or (gene == 'Y' or gene == 'X'):
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+AND+00000.0100:+00001.0000[GLOBAL_MAF]+AND+{clinsignificance1}+AND+{gene}[Chromosome]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-                elif (':' not in gene) and (not gene.isnumeric()) and (not(gene == 'Y' or gene == 'X')):
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+AND+00000.0100:+00001.0000[GLOBAL_MAF]+AND+{clinsignificance1}+AND+{gene}[Gene Name]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-                elif (':' in gene) and ('-' in gene):
-                    x = gene.split(':')
-                    y = x[1].split('-')
-                    chrom = x[0]
-                    bpstart = y[0]
-                    bpend = y[1]
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+AND+00000.0100:+00001.0000[GLOBAL_MAF]AND+{clinsignificance1}+AND+({chrom}[Chromosome]+AND+({bpstart}[CHRPOS]+:+{bpend}[CHRPOS]))&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-            elif gene != '(optional)' and self.commonfill.isChecked() == False:
-                if gene.isnumeric() or (gene == 'Y' or gene == 'X'):
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+NOT+00000.0000[Global Minor Allele Frequency]+AND+{clinsignificance1}[Clinical Significance]+AND+{gene}[Chromosome]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-                elif (':' not in gene) and (not gene.isnumeric()) and (not(gene == 'Y' or gene == 'X')):
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+NOT+00000.0000[Global Minor Allele Frequency]+AND+{clinsignificance1}[Clinical Significance]+AND+{gene}[Gene Name]&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-                elif (':' in gene) and ('-' in gene):
-                    x = gene.split(':')
-                    y = x[1].split('-')
-                    chrom = x[0]
-                    bpstart = y[0]
-                    bpend = y[1]
-                    r = requests.get(
-                        f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=snp&term=1000genomes+has+frequency+filter[Filter]+AND+snv[SNP Class]+NOT+00000.0000[Global Minor Allele Frequency]+AND+{clinsignificance1}[Clinical Significance]+AND+({chrom}[Chromosome]+AND+({bpstart}[CHRPOS]+:+{bpend}[CHRPOS]))&retstart={retstart}&retmax={retmax}&retmode=json&sort=SNP_ID')
-            data = json.loads(r.content)
-            strlist = (data['esearchresult']['idlist'])
-            numlist = [int(x) for x in strlist]
-            UIDlist = sorted(numlist)
-            self.label.setText(
-                f"SNPs: {len(UIDlist)}/{data['esearchresult']['count']}")
-
-        return UIDlist
-
-    def infosum(self, uid):
-        '''creates the data summary for the SNV'''
-        rsSNV = 'rs' + str(uid.text())
-        server = "https://rest.ensembl.org"
-        ext = f"/variation/human/{rsSNV}?phenotypes=1"
-        r = requests.get(
-            server+ext, headers={"Content-Type": "application/json"}).json()
-        Seq = r['mappings'][0]['allele_string']
-        Minor_Allele = r['minor_allele']
-        func = r['most_severe_consequence']
-        clinical = ''
-        Traits = ''
-        AltTraits = ''
-        Gene = ''
-        if r['phenotypes']:
-            for items in r['phenotypes']:
-                if 'risk_allele' in items:
-                    if 'genes' in items:
-                        Gene = items['genes']
-                    if items['risk_allele'] == Minor_Allele:
-                        Trait = items['trait']
-                        if Trait not in Traits:
-                            Traits += f'{Trait}\n'
-                    elif items['risk_allele'] != Minor_Allele:
-                        AltTrait = str(items['risk_allele']) + \
-                            '->'+str(items['trait']).lower()
-                        if AltTrait not in AltTraits:
-                            AltTraits += f'{AltTrait}\n'
-        try:
-            for item in r['clinical_significance']:
-                clinical += f'{item}\n'
-        except KeyError:
-            clinical += 'N\A'
-        self.label_8.setText(f"Name={rsSNV}\n"
-                             "\n"
-                             f"Minor Allele={Minor_Allele}\n"
-                             "\n"
-                             f"Sequence={Seq}\n"
-                             "\n"
-                             f"Gene={Gene}\n"
-                             "\n"
-                             f"Function=\n{func}\n"
-                             "\n"
-                             f"Traits=\n{Traits.lower()}"
-                             "\n"
-                             f"Major Allele Traits=\n{AltTraits}"
-                             "\n"
-                             f"Clinical Significance=\n{clinical}"
-                             )
-
-    def Phenfinder(self, UIDlist):
-        '''Finds the data to fill the table'''
-        newls = [("rs" + str(n)) for n in UIDlist]
-        UIDliststr = str(newls).replace("'", '"')
-        server = "https://rest.ensembl.org"
-        ext = "/variation/homo_sapiens?phenotypes=1"
-        data = '{"ids":' + UIDliststr + '}'
-        headers = {"Content-Type": "application/json",
-                   "Accept": "application/json"}
-        r = requests.post(server+ext, headers=headers,
-                          data=data)
-
-        decoded = json.loads(r.content)
-        decodeduidsorted = sorted([int(uid.strip('rs'))
-                                   for uid in decoded.keys()])
-        true_uidlist = ['rs' + str(uid) for uid in decodeduidsorted]
-        clinicallist = []
-        funclist = []
-        AltTraitlist = []
-        Traitlist = []
-        Genelist = []
-        for uid in true_uidlist:
-            AltTraitsstring = ''
-            Traitstring = ''
-            AltTraitsstring = ''
-            Gene = ''
-            try:
-                funclist.append(decoded[uid]['most_severe_consequence'])
-            except KeyError:
-                funclist.append('Not specified')
-            try:
-                clinicallist.append(
-                    str(decoded[uid]["clinical_significance"]).strip('[]'))
-            except KeyError:
-                clinicallist.append("Not specified")
-            for items in decoded[uid]["phenotypes"]:
-                try:
-                    Gene = items['genes']
-                except KeyError:
-                    Gene = 'Not specified'
-                try:
-                    if items["risk_allele"] == decoded[uid]["minor_allele"]:
-                        try:
-                            Trait = items['trait']
-                            if Trait.lower() not in Traitstring:
-                                Traitstring += f'|{Trait.lower()}|'
-                        except KeyError:
-                            Traitstring = 'Not specified'
-                    else:
-                        try:
-                            AltTrait = items['trait']
-                            if AltTrait.lower() not in AltTraitsstring:
-                                AltTraitsstring = f'|{AltTrait.lower()}|'
-                        except KeyError:
-                            AltTraitsstring = 'Not specified'
-                except KeyError:
-                    continue
-            AltTraitlist.append(AltTraitsstring)
-            Traitlist.append(Traitstring)
-            Genelist.append(Gene)
-
-        return [funclist, Genelist, Traitlist, AltTraitlist, clinicallist]
-
-    def Popfinder(self, UIDlist):
-        '''Finds the data to fill the table'''
-        newls = [("rs" + str(n)) for n in UIDlist]
-        UIDliststr = str(newls).replace("'", '"')
-        server = "https://rest.ensembl.org"
-        ext = "/variation/homo_sapiens?pops=1"
-        data = '{"ids":' + UIDliststr + '}'
-        headers = {"Content-Type": "application/json",
-                   "Accept": "application/json"}
-        r = requests.post(server+ext, headers=headers,
-                          data=data)
-
-        decoded = json.loads(r.content)
-        chromosome = []
-        popdata = []
-        position = []
-        minor_allele = []
-        major_allele = []
-
-        decodeduidsorted = sorted([int(uid.strip('rs'))
-                                   for uid in decoded.keys()])
-        true_uidlist = ['rs' + str(uid) for uid in decodeduidsorted]
-        for uid in true_uidlist:
-            popdict = {}
-            Allslist = []
-            AFRlist = []
-            AMRlist = []
-            EASlist = []
-            EURlist = []
-            SASlist = []
-            major = ''
-            minor = ''
-
-            try:
-                minor += decoded[uid]["minor_allele"]
-                minor_allele.append(minor)
-            except TypeError:
-                minor_allele.append('NA')
-
-            if len(decoded[uid]["mappings"]) > 1:
-                try:
-                    chromosome.append(
-                        (decoded[uid]["mappings"][0]["location"].split(':'))[0])
-                    position.append(
-                        (decoded[uid]["mappings"][0]["location"].split('-'))[1])
-                    major = decoded[uid]["mappings"][0]["allele_string"].split(
-                        '/')[0]
-                    if major != minor:
-                        major_allele.append(major)
-                        major = ''
-                    else:
-                        major_allele.append(decoded[uid]["mappings"][0]["allele_string"].split(
-                            '/')[1])
-                        major = ''
-
-                except KeyError:
-                    chromosome.append('NA')
-                    position.append('NA')
-            else:
-                for items in decoded[uid]["mappings"]:
-                    try:
-                        chromosome.append((items["location"].split(':'))[0])
-                        position.append(
-                            (items["location"].split('-'))[1])
-                        if len(items["allele_string"]) > 3:
-                            major = items["ancestral_allele"]
-                            major_allele.append(major)
-                        else:
-                            major = items["allele_string"].split('/')[0]
-                            if major != minor:
-                                major_allele.append(major)
-                            else:
-                                major_allele.append(
-                                    items["allele_string"].split('/')[1])
-                    except KeyError:
-                        chromosome.append('NA')
-                        position.append('NA')
-            for items in decoded[uid]['populations']:
-                if items['population'] == '1000GENOMES:phase_3:ALL':
-                    Allslist.append(items["frequency"])
-                    popdict['1000GENOMES:phase_3:ALL_major'] = max(Allslist)
-                    if min(Allslist) == 1:
-                        popdict['1000GENOMES:phase_3:ALL_minor'] = 0
-                    else:
-                        popdict['1000GENOMES:phase_3:ALL_minor'] = min(
-                            Allslist)
-                if items['population'] == '1000GENOMES:phase_3:AFR':
-                    AFRlist.append(items["frequency"])
-                    popdict['1000GENOMES:phase_3:AFR_major'] = max(AFRlist)
-                    if min(AFRlist) == 1:
-                        popdict['1000GENOMES:phase_3:AFR_minor'] = 0
-                    else:
-                        popdict['1000GENOMES:phase_3:AFR_minor'] = min(AFRlist)
-                if items['population'] == '1000GENOMES:phase_3:AMR':
-                    AMRlist.append(items["frequency"])
-                    popdict['1000GENOMES:phase_3:AMR_major'] = max(AMRlist)
-                    if min(AMRlist) == 1:
-                        popdict['1000GENOMES:phase_3:AMR_minor'] = 0
-                    else:
-                        popdict['1000GENOMES:phase_3:AMR_minor'] = min(AMRlist)
-                if items['population'] == '1000GENOMES:phase_3:EAS':
-                    EASlist.append(items["frequency"])
-                    popdict['1000GENOMES:phase_3:EAS_major'] = max(EASlist)
-                    if min(EASlist) == 1:
-                        popdict['1000GENOMES:phase_3:EAS_minor'] = 0
-                    else:
-                        popdict['1000GENOMES:phase_3:EAS_minor'] = min(EASlist)
-                if items['population'] == '1000GENOMES:phase_3:EUR':
-                    EURlist.append(items["frequency"])
-                    popdict['1000GENOMES:phase_3:EUR_major'] = max(EURlist)
-                    if min(EURlist) == 1:
-                        popdict['1000GENOMES:phase_3:EUR_minor'] = 0
-                    else:
-                        popdict['1000GENOMES:phase_3:EUR_minor'] = min(EURlist)
-                if items['population'] == '1000GENOMES:phase_3:SAS':
-                    SASlist.append(items["frequency"])
-                    popdict['1000GENOMES:phase_3:SAS_major'] = max(SASlist)
-                    if min(SASlist) == 1:
-                        popdict['1000GENOMES:phase_3:SAS_minor'] = 0
-                    else:
-                        popdict['1000GENOMES:phase_3:SAS_minor'] = min(SASlist)
-            popdata.append(popdict)
-
-        return [newls, chromosome, position, minor_allele, major_allele, popdata]
-
-    def Genotypefinder(self, UIDlist):
-        '''Finds the data to fill the table'''
-        newls = [("rs" + str(n)) for n in UIDlist]
-        UIDliststr = str(newls).replace("'", '"')
-        server = "https://rest.ensembl.org"
-        ext = "/variation/homo_sapiens?population_genotypes=1"
-        data = '{"ids":' + UIDliststr + '}'
-        headers = {"Content-Type": "application/json",
-                   "Accept": "application/json"}
-        r = requests.post(server+ext, headers=headers,
-                          data=data)
-
-        decoded = json.loads(r.content)
-        decodeduidsorted = sorted([int(uid.strip('rs'))
-                                   for uid in decoded.keys()])
-        true_uidlist = ['rs' + str(uid) for uid in decodeduidsorted]
-
-        keys = ['majorhomozygousALL', 'majorhomozygousAFR',
-                'majorhomozygousAMR', 'majorhomozygousEAS',
-                'majorhomozygousEUR', 'majorhomozygousSAS',
-                'minorhomozygousALL', 'minorhomozygousAFR',
-                'minorhomozygousAMR', 'minorhomozygousEAS',
-                'minorhomozygousEUR', 'minorhomozygousSAS',
-                'heterozygousALL', 'heterozygousAFR',
-                'heterozygousAMR', 'heterozygousEAS',
-                'heterozygousEUR', 'heterozygousSAS']
-
-        Genotypelist = []
-
-        for uid in true_uidlist:
-            gendict = {}
-            minorallele = decoded[uid]['minor_allele']
-
-            for items in decoded[uid]['population_genotypes']:
-                if items['population'] == '1000GENOMES:phase_3:ALL':
-                    # filter heterozygotous genotypes
-                    if (items['genotype'].split('|')[0] == minorallele or items['genotype'].split('|')[1] == minorallele) and not items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['heterozygousALL'] = items['frequency']
-                    # filter Minor allele Homozygous genotypes
-                    if items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['minorhomozygousALL'] = items['frequency']
-                    # filter Major allele Homozygous genotypes
-                    if (items['genotype'].split('|')[0] != minorallele) and (items['genotype'].split('|')[1] != minorallele):
-                        gendict['majorhomozygousALL'] = items['frequency']
-                if items['population'] == '1000GENOMES:phase_3:AFR':
-                    if (items['genotype'].split('|')[0] == minorallele or items['genotype'].split('|')[1] == minorallele) and not items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['heterozygousAFR'] = items['frequency']
-                    if items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['minorhomozygousAFR'] = items['frequency']
-                    if (items['genotype'].split('|')[0] != minorallele) and (items['genotype'].split('|')[1] != minorallele):
-                        gendict['majorhomozygousAFR'] = items['frequency']
-                if items['population'] == '1000GENOMES:phase_3:AMR':
-                    if (items['genotype'].split('|')[0] == minorallele or items['genotype'].split('|')[1] == minorallele) and not items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['heterozygousAMR'] = items['frequency']
-                    if items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['minorhomozygousAMR'] = items['frequency']
-                    if (items['genotype'].split('|')[0] != minorallele) and (items['genotype'].split('|')[1] != minorallele):
-                        gendict['majorhomozygousAMR'] = items['frequency']
-                if items['population'] == '1000GENOMES:phase_3:EAS':
-                    if (items['genotype'].split('|')[0] == minorallele or items['genotype'].split('|')[1] == minorallele) and not items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['heterozygousEAS'] = items['frequency']
-                    if items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['minorhomozygousEAS'] = items['frequency']
-                    if (items['genotype'].split('|')[0] != minorallele) and (items['genotype'].split('|')[1] != minorallele):
-                        gendict['majorhomozygousEAS'] = items['frequency']
-                if items['population'] == '1000GENOMES:phase_3:EUR':
-                    if (items['genotype'].split('|')[0] == minorallele or items['genotype'].split('|')[1] == minorallele) and not items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['heterozygousEUR'] = items['frequency']
-                    if items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['minorhomozygousEUR'] = items['frequency']
-                    if (items['genotype'].split('|')[0] != minorallele) and (items['genotype'].split('|')[1] != minorallele):
-                        gendict['majorhomozygousEUR'] = items['frequency']
-                if items['population'] == '1000GENOMES:phase_3:SAS':
-                    if (items['genotype'].split('|')[0] == minorallele or items['genotype'].split('|')[1] == minorallele) and not items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['heterozygousSAS'] = items['frequency']
-                    if items['genotype'] == f'{minorallele}|{minorallele}':
-                        gendict['minorhomozygousSAS'] = items['frequency']
-                    if (items['genotype'].split('|')[0] != minorallele) and (items['genotype'].split('|')[1] != minorallele):
-                        gendict['majorhomozygousSAS'] = items['frequency']
-                for items in keys:
-                    if items not in gendict.keys():
-                        gendict[items] = 0
-            Genotypelist.append(gendict)
-
-        return Genotypelist
     # Functions regarding the main thread/UI
     #########################################################################################################################################################################################################
 
     def Selected_UID_list(self):
-        '''Iterates over the Selected UID list'''
-        selectedlist = []
-        for i in range(self.SelectedUID.count()):
-            selectedlist.append(self.SelectedUID.item(i).text())
-        return selectedlist
+        '''Returns the selected UIDs in selection order'''
+        return self.Selectionmodel.uids()
 
     def clear_all(self):
         '''Cleards all data'''
         self.UIDlist.clear()
-        self.SelectedUID.clear()
-        self.DataTable.clearContents()
-        self.DataTable.model().removeRows(0, self.DataTable.rowCount())
+        self.Summaryprefetch.clear()
+        self.Selectionmodel.clear()
+        self.Tablemodel.clear()
         self.genename.setText('(optional)')
         self.genename.setEnabled(True)
         self.clinsignificance.setEnabled(True)
@@ -823,13 +526,13 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
 
     def clear_selection(self):
         '''Clears the selection'''
-        self.SelectedUID.clear()
+        self.Selectionmodel.clear()
         self.label_2.setText("Selected SNPs:")
 
-    def remove_item(self, item):
-        '''Removes the item clicked from the Selected UIDs list'''
-        self.SelectedUID.takeItem(self.SelectedUID.row(item))
-        self.label_2.setText(str(len(self.Selected_UID_list())) + ' UIDs')
+    def remove_item(self, index):
+        '''Removes the UID clicked from the Selected UIDs list'''
+        self.Selectionmodel.remove(index.row())
+        self.label_2.setText(str(len(self.Selectionmodel)) + ' SNPs')
 
     def UID_list(self):
         '''Iterates over the UID list'''
@@ -839,17 +542,15 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         return uidlist
 
     def get_all(self):
-        for item in self.UID_list():
-            if item not in self.Selected_UID_list():
-                self.SelectedUID.addItem(item)
+        '''Passes all the UIDs into the Selected UIDs list in one insertion'''
+        self.Selectionmodel.add(self.UID_list())
         self.SelectAll.setCheckState(False)
-        self.label_2.setText(str(len(self.Selected_UID_list())) + ' SNPs')
+        self.label_2.setText(str(len(self.Selectionmodel)) + ' SNPs')
 
     def get_one(self, item):
         '''Passes one UID into Selected UIDs list if it isnt already there'''
-        if item.text() not in self.Selected_UID_list():
-            self.SelectedUID.addItem(item.text())
-        self.label_2.setText(str(len(self.Selected_UID_list())) + ' SNPs')
+        self.Selectionmodel.add([item.text()])
+        self.label_2.setText(str(len(self.Selectionmodel)) + ' SNPs')
 # Ui Elements
     ##############################################################################################################################################################################
 
@@ -857,6 +558,25 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
 
         # connection to thread
         self.threadpool = QtCore.QThreadPool()
+        self.jobs = []
+        # summaries of the UID list, prefetched once the list stays still
+        self.Summaryprefetch = Summaryprefetch(self.threadpool)
+        self.Prefetchtimer = QtCore.QTimer()
+        self.Prefetchtimer.setSingleShot(True)
+        self.Prefetchtimer.setInterval(PREFETCH_DELAY)
+        self.Prefetchtimer.timeout.connect(self.prefetch_visible)
+
+        # local cache of the Ensembl variation records
+        Snpcore.CACHE = Snpcache.Defaultcache(Snpcore.Ensemblrelease)
+        if os.environ.get('SNPOP_INDEX'):
+            import Snpindex
+            Snpcore.INDEX = Snpindex.Variantindex.load(os.environ['SNPOP_INDEX'])
+        if os.environ.get('SNPOP_VCF'):
+            import Snpvcf
+            Snpcore.VCF = Snpvcf.Defaultsource()
+            if Snpcore.VCF and os.environ.get('SNPOP_GROUPS'):
+                Snpcore.POPULATIONS = Snpcore.POPULATIONS + Snpcore.VCF.addgroups(
+                    Snpvcf.Readgroups(os.environ['SNPOP_GROUPS']))
 
         # Mainwindow
         MainWindow.setObjectName("MainWindow")
@@ -907,6 +627,8 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         self.UIDlist = QtWidgets.QListWidget(self.gridLayoutWidget)
         self.UIDlist.itemDoubleClicked.connect(self.get_one)
         self.UIDlist.itemClicked.connect(self.UIDclicked)
+        self.UIDlist.setUniformItemSizes(True)
+        self.UIDlist.verticalScrollBar().valueChanged.connect(self.Prefetchtimer.start)
         self.UIDlist.setObjectName("UIDlist")
         self.UIDlayout.addWidget(self.UIDlist, 7, 1, 1, 2)
 
@@ -935,7 +657,12 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         self.RetrieveUIDs = QtWidgets.QPushButton(self.gridLayoutWidget)
         self.RetrieveUIDs.clicked.connect(self.RetrieveSNPs_clicked)
         self.RetrieveUIDs.setObjectName("RetrieveUIDs")
-        self.UIDlayout.addWidget(self.RetrieveUIDs, 5, 1, 1, 5)
+        self.UIDlayout.addWidget(self.RetrieveUIDs, 5, 1, 1, 3)
+
+        # Fetch all checkbox
+        self.Fetchall = QtWidgets.QCheckBox(self.gridLayoutWidget)
+        self.Fetchall.setObjectName("Fetchall")
+        self.UIDlayout.addWidget(self.Fetchall, 5, 4, 1, 2)
 
         self.label = QtWidgets.QLabel(self.gridLayoutWidget)
         self.label.setObjectName("label")
@@ -943,7 +670,7 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
 
         # Retmax Spinbox
         self.Retmax = QtWidgets.QSpinBox(self.gridLayoutWidget)
-        self.Retmax.setRange(0, 100)
+        self.Retmax.setRange(0, 10000)
         self.Retmax.setObjectName("Retmax")
         self.UIDlayout.addWidget(self.Retmax, 2, 2, 1, 1)
 
@@ -991,6 +718,7 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         self.label_8 = QtWidgets.QLabel(self.scrollAreaWidgetContents)
         self.label_8.setFrameShape(QtWidgets.QFrame.NoFrame)
         self.label_8.setObjectName("label_8")
+        self.Summaryprefetch.ready.connect(self.label_8.setText)
         self.verticalLayout_2.addWidget(self.label_8)
         self.scrollArea.setWidget(self.scrollAreaWidgetContents)
         self.UIDlayout.addWidget(self.scrollArea, 7, 3, 1, 3)
@@ -1008,19 +736,13 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         self.Freqlayout.addWidget(self.label_7, 0, 0, 1, 1)
 
         # Freq Table
-        self.DataTable = QtWidgets.QTableWidget(self.gridLayoutWidget_2)
+        self.DataTable = QtWidgets.QTableView(self.gridLayoutWidget_2)
         self.DataTable.setEnabled(True)
-        self.DataTable.setColumnCount(40)
-        self.DataTable.setHorizontalHeaderLabels(
-            [' SNP ', 'Chromosome', 'Position', 'Minor allele', 'Major allele', 'Total minor allele frequency', 'Total major allele frequency', 'African minor allele frequency ',
-             'African major allele frequency', 'European minor allele frequency', 'European major allele frequency', 'American minor allele frequency', 'American major allele frequency',
-             'East Asian minor allele frequency', 'East Asian major allele frequency', 'South Asian minor allele frequency', 'South Asian major allele frequency',
-             'Function', 'Gene', 'Minor allele traits', 'Major allele traits', 'Clinical Significance', 'Total heterozygous', 'Total minor allele homozygous', 'Total major allele homozygous',
-             'African heterozygous', 'African minor allele homozygous', 'African major allele homozygous', 'European heterozygous', 'European minor allele homozygous', 'European major allele homozygous',
-             'American heterozygous', 'American minor allele homozygous', 'American major allele homozygous', 'East Asian heterozygous', 'East Asian minor allele homozygous', 'East Asian major allele homozygous',
-             'South Asian heterozygous', 'South Asian minor allele homozygous', 'South Asian major allele homozygous'])
+        self.Tablemodel = Variantmodel(Snpcore.Columns(), self.DataTable)
+        self.DataTable.setModel(self.Tablemodel)
         self.DataTable.resizeColumnsToContents()
-        self.DataTable.resizeRowsToContents()
+        self.DataTable.verticalHeader().setDefaultSectionSize(
+            self.DataTable.verticalHeader().minimumSectionSize())
         self.DataTable.setObjectName("DataTable")
         self.Freqlayout.addWidget(self.DataTable, 6, 0, 1, 1)
 
@@ -1087,6 +809,13 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         self.Clearbut.setObjectName("Clearbut")
         self.gridLayout.addWidget(self.Clearbut, 0, 2, 1, 1)
 
+        # Cancel button
+        self.Cancelbut = QtWidgets.QPushButton(self.gridLayoutWidget_3)
+        self.Cancelbut.clicked.connect(self.cancel_clicked)
+        self.Cancelbut.setEnabled(False)
+        self.Cancelbut.setObjectName("Cancelbut")
+        self.gridLayout.addWidget(self.Cancelbut, 0, 4, 1, 1)
+
         # Static
         self.line_3 = QtWidgets.QFrame(self.gridLayoutWidget_3)
         self.line_3.setFrameShadow(QtWidgets.QFrame.Plain)
@@ -1146,10 +875,14 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         self.gridLayout_2.addWidget(self.Clearselection, 1, 1, 1, 1)
 
         # Selected UID list
-        self.SelectedUID = QtWidgets.QListWidget(self.gridLayoutWidget_4)
+        # view over the selection model, only the visible rows are laid out and drawn
+        self.Selectionmodel = Selectionmodel()
+        self.SelectedUID = QtWidgets.QListView(self.gridLayoutWidget_4)
+        self.SelectedUID.setModel(self.Selectionmodel)
+        self.SelectedUID.setUniformItemSizes(True)
         self.SelectedUID.setEnabled(True)
         self.SelectedUID.setMouseTracking(False)
-        self.SelectedUID.itemClicked.connect(self.remove_item)
+        self.SelectedUID.clicked.connect(self.remove_item)
         self.SelectedUID.setObjectName("SelectedUID")
         self.gridLayout_2.addWidget(self.SelectedUID, 3, 1, 1, 1)
 
@@ -1191,6 +924,9 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
                                                 "<p align=\"center\" style=\" margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;\">Retrieve Available SNPs from the DbSNP database </p>\n"
                                                 "<p align=\"center\" style=\" margin-top:0px; margin-bottom:0px; margin-left:0px; margin-right:0px; -qt-block-indent:0; text-indent:0px;\">based on Filters and the Retstart and Retmax values.</p></body></html>"))
         self.RetrieveUIDs.setText(_translate("MainWindow", "Retrieve SNPs"))
+        self.Fetchall.setToolTip(_translate(
+            "MainWindow", "<html><head/><body><p align=\"center\">Retrieves all the SNPs of the search from the Start value on, ignoring the Stop value</p></body></html>"))
+        self.Fetchall.setText(_translate("MainWindow", "All"))
         self.label.setText(_translate(
             "MainWindow", "SNPs: Shown/Hits"))
         self.Retmax.setToolTip(_translate(
@@ -1225,7 +961,7 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
         self.label_7.setText(_translate(
             "MainWindow", "                                                       For the selected SNPs:"))
         self.GetFreq.setToolTip(_translate(
-            "MainWindow", "<html><head/><body><p>Gets the frequency and other data for up to 100 SNPs</p></body></html>"))
+            "MainWindow", "<html><head/><body><p>Gets the frequency and other data for the selected SNPs</p></body></html>"))
         self.GetFreq.setText(_translate("MainWindow", "Get Data"))
         self.Title.setText(_translate("MainWindow", "SNP Finder"))
         self.label_6.setText(_translate(
@@ -1239,6 +975,9 @@ class Ui_MainWindow(QtWidgets.QMainWindow):
             "MainWindow", "Clear all the data/Reset"))
         self.process.setText(_translate(
             "MainWindow", "No process running: waiting for input"))
+        self.Cancelbut.setToolTip(_translate(
+            "MainWindow", "Stops the running SNP search or data retrieval"))
+        self.Cancelbut.setText(_translate("MainWindow", "Cancel"))
         self.SelectAll.setToolTip(_translate(
             "MainWindow", "<html><head/><body><p align=\"center\">Selects all the SNPs Retrieved from the Available SNPs list</p></body></html>"))
         self.SelectAll.setText(_translate("MainWindow", "Select All"))
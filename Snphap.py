@@ -0,0 +1,100 @@
+import os
+import sys
+import csv
+import argparse
+import numpy as np
+import Snpvcf
+import Snpld
+
+
+# Constants
+###########################################################################################
+# Decimals of the haplotype frequencies (as LDlink)
+DECIMALS = 4
+
+
+# Haplotype functions
+###########################################################################################
+
+def Packhaplotypes(calls):
+    '''Packs every haplotype (row of allele indexes) into a fixed size byte string:
+            one bit per SNP for biallelic SNP sets, otherwise one byte per SNP
+            Output = the (haplotypes,) void array of the packed haplotypes'''
+    if calls.max(initial=0) <= 1:
+        packed = np.packbits(calls.astype(np.uint8), axis=1)
+    else:
+        packed = calls.astype(np.uint8)
+    packed = np.ascontiguousarray(packed)
+    return packed.view(np.dtype((np.void, packed.shape[1]))).ravel()
+
+
+def Haplotypecounts(calls, weights):
+    '''Counts the haplotypes of every population with one unique pass over the packed haplotypes and one
+            product with the population membership; haplotypes with a missing allele are left out
+            Output = the (distinct haplotypes, SNPs) allele indexes and the (populations, distinct haplotypes) counts'''
+    complete = (calls >= 0).all(axis=1)
+    calls = calls[complete]
+    keys, first, inverse = np.unique(Packhaplotypes(calls), return_index=True,
+                                     return_inverse=True)
+    onehot = np.zeros((len(calls), len(keys)), dtype=np.float32)
+    onehot[np.arange(len(calls)), inverse.ravel()] = 1
+    return calls[first], weights[:, complete] @ onehot
+
+
+def Haplotypetable(rsids, alleles, haplotypes, counts):
+    '''Returns the LDlink LDhap table of a population: one column per SNP with the haplotype alleles,
+            then Count and Frequency, most frequent haplotype first'''
+    total = counts.sum()
+    rows = []
+    for h in np.argsort(-counts, kind='stable'):
+        if counts[h]:
+            rows.append([alleles[snp][allele] for snp, allele in enumerate(haplotypes[h])] +
+                        [int(counts[h]), round(float(counts[h]) / float(total), DECIMALS)])
+    return [list(rsids) + ['Count', 'Frequency']] + rows
+
+
+def Haplotypefiles(source, rsids, populations=Snpld.DEFAULT_POPULATIONS, folder='.'):
+    '''Counts the haplotypes of the rsIDs for all the populations and writes one haplotypes_<population>.csv
+            table per population to folder
+            Output = the rsIDs found in the VCFs, in position order'''
+    found, alleles, calls = Snpld.Phasedcalls(source, rsids)
+    if not found:
+        raise ValueError('none of the rsIDs are in the VCFs')
+    haplotypes, counts = Haplotypecounts(calls, Snpld.Populationweights(source, populations))
+    os.makedirs(folder, exist_ok=True)
+    for p, population in enumerate(populations):
+        with open(os.path.join(folder, f'haplotypes_{population}.csv'), 'w', newline='') as handle:
+            csv.writer(handle).writerows(Haplotypetable(found, alleles, haplotypes, counts[p]))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Count the haplotypes of SNPs from local phased 1000 Genomes VCFs.')
+    parser.add_argument('rsids', nargs='+')
+    parser.add_argument('--populations', nargs='*', default=Snpld.DEFAULT_POPULATIONS,
+                        help='1000 Genomes populations (e.g. EUR, TSI) and/or custom groups')
+    parser.add_argument('--vcf', nargs='*',
+                        help='bgzipped, tabix indexed VCFs or folders of them (default: SNPOP_VCF)')
+    parser.add_argument('--panel', default=os.environ.get('SNPOP_PANEL'),
+                        help='1000 Genomes sample panel file (default: SNPOP_PANEL)')
+    parser.add_argument('--groups', default=os.environ.get('SNPOP_GROUPS'),
+                        help='custom population groups file (default: SNPOP_GROUPS)')
+    parser.add_argument('-o', '--output', default='.', help='folder the tables are written to')
+    args = parser.parse_args(argv)
+    args.vcf = args.vcf or [path for path in os.environ.get('SNPOP_VCF', '').split(',') if path]
+    if not args.vcf or not args.panel:
+        parser.error('the VCFs and the panel are needed (--vcf/--panel or SNPOP_VCF/SNPOP_PANEL)')
+
+    source = Snpvcf.Vcfsource(args.vcf, args.panel)
+    if args.groups:
+        source.addgroups(Snpvcf.Readgroups(args.groups))
+    found = Haplotypefiles(source, args.rsids, args.populations, args.output)
+    missing = sorted(set(args.rsids) - set(found))
+    if missing:
+        print(f'not in the VCFs: {" ".join(missing)}', file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import time
+import random
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Constants
+###########################################################################################
+# Requests per second allowed for each host (Ensembl: 55000/hour, E-utilities: 3/s or 10/s with an API key)
+HOST_RATES = {'rest.ensembl.org': 15,
+              'eutils.ncbi.nlm.nih.gov': 3}
+DEFAULT_RATE = 10
+# (connect, read) timeout of each request in seconds
+TIMEOUT = (10, 120)
+# Attempts per request before giving up
+RETRIES = 5
+# First backoff delay in seconds, doubled on every retry
+BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+POOL_SIZE = 16
+
+
+# Rate limiter class
+###########################################################################################
+class Tokenbucket():
+    '''Token bucket allowing rate requests per second with bursts of up to capacity requests'''
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, job=None):
+        '''Blocks until a request may be sent, or until the Snpjob.Job (optional) is cancelled'''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now,
+                           (1 - self.tokens) / self.rate)
+            if job:
+                job.sleep(wait)
+            else:
+                time.sleep(wait)
+
+    def block(self, seconds):
+        '''Stops every request to the host for seconds (e.g. after a 429 Retry-After)'''
+        with self.lock:
+            self.blocked_until = max(
+                self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+# HTTP client class
+###########################################################################################
+class Client():
+    '''Pooled keep-alive HTTP client shared by all the fetchers, with per host rate limits,
+    per request timeouts and exponential backoff retries honoring Retry-After'''
+
+    def __init__(self, rates=None, timeout=TIMEOUT, retries=RETRIES, backoff=BACKOFF, pool_size=POOL_SIZE):
+        self.rates = dict(HOST_RATES, **(rates or {}))
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, url):
+        '''Returns the token bucket of the host of url'''
+        host = urlsplit(url).hostname
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = Tokenbucket(
+                    self.rates.get(host, DEFAULT_RATE))
+            return self.buckets[host]
+
+    def set_rate(self, host, rate):
+        '''Changes the requests per second allowed for host'''
+        with self.lock:
+            self.rates[host] = rate
+            self.buckets.pop(host, None)
+
+    def delay(self, attempt, response=None):
+        '''Returns the seconds to wait before retrying, from Retry-After if the server sent it'''
+        if response is not None and 'Retry-After' in response.headers:
+            try:
+                return min(float(response.headers['Retry-After']), MAX_BACKOFF)
+            except ValueError:
+                pass
+        return min(self.backoff * 2 ** attempt, MAX_BACKOFF) * (0.5 + random.random() / 2)
+
+    def request(self, method, url, job=None, **kwargs):
+        '''Sends a request, retrying throttled, failed and timed out ones. With a Snpjob.Job the body is
+                streamed through it, so the bytes are counted and cancelling the job aborts the request.
+                With stream=True the body is left to the caller (to read with job.chunks() if there is a job).
+                Output = the requests.Response, raises requests.HTTPError if all the attempts failed'''
+        kwargs.setdefault('timeout', self.timeout)
+        streamed = kwargs.get('stream', False)
+        if job:
+            kwargs['stream'] = True
+        sleep = job.sleep if job else time.sleep
+        bucket = self.bucket(url)
+        for attempt in range(self.retries):
+            if job:
+                job.check()
+            bucket.acquire(job)
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.retries - 1:
+                    raise
+                sleep(self.delay(attempt))
+                continue
+            if response.status_code in RETRY_STATUS and attempt < self.retries - 1:
+                wait = self.delay(attempt, response)
+                response.close()
+                if response.status_code == 429:
+                    bucket.block(wait)
+                else:
+                    sleep(wait)
+                continue
+            if job and not streamed:
+                # fills the body requests would have read on first access of response.content
+                response._content = job.read(response)
+            response.raise_for_status()
+            return response
+
+    def get(self, url, job=None, **kwargs):
+        return self.request('GET', url, job, **kwargs)
+
+    def post(self, url, job=None, **kwargs):
+        return self.request('POST', url, job, **kwargs)
+
+
+CLIENT = Client()
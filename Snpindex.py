@@ -0,0 +1,232 @@
+import sys
+import gzip
+from array import array
+import argparse
+import numpy as np
+import Snpcore
+
+
+# Constants
+###########################################################################################
+# Clinical significance classes, a variant keeps one bit per class it was given
+SIGNIFICANCE = ['benign', 'likely benign', 'pathogenic', 'likely pathogenic',
+                'conflicting interpretations of pathogenicity', 'drug response', 'protective',
+                'risk factor', 'uncertain significance']
+# dbSNP CLNSIG codes
+CLNSIG_CODES = {'0': 'uncertain significance', '2': 'benign', '3': 'likely benign',
+                '4': 'likely pathogenic', '5': 'pathogenic', '6': 'drug response'}
+# MAF range of the common variants filter (same as the esearch term)
+COMMON_MAF = (0.01, 1.0)
+
+
+# Parsing functions
+###########################################################################################
+
+def Openfile(path):
+    return gzip.open(path, 'rt') if path.endswith('.gz') else open(path)
+
+
+def Chromosome(name):
+    '''Returns the chromosome name without the chr prefix'''
+    name = name[3:] if name.lower().startswith('chr') else name
+    return 'MT' if name == 'M' else name
+
+
+def Readgenes(path):
+    '''Reads the gene lines of a GTF or GFF3 file
+            Output = dict of upper case gene name -> (chromosome, start, end)'''
+    genes = {}
+    with Openfile(path) as handle:
+        for line in handle:
+            if line.startswith('#'):
+                continue
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 9 or fields[2] != 'gene':
+                continue
+            name = None
+            for attribute in fields[8].split(';'):
+                attribute = attribute.strip()
+                # GTF: gene_name "NAT2", GFF3: Name=NAT2 or gene_name=NAT2
+                for key in ('gene_name ', 'gene_name=', 'Name='):
+                    if attribute.startswith(key):
+                        name = attribute[len(key):].strip('"')
+                if name:
+                    break
+            if not name:
+                continue
+            gene = (Chromosome(fields[0]), int(fields[3]), int(fields[4]))
+            # genes on more than one contig keep their primary assembly location
+            if name.upper() not in genes or len(gene[0]) < len(genes[name.upper()][0]):
+                genes[name.upper()] = gene
+    return genes
+
+
+def Significance(value):
+    '''Returns the clinical significance bits of a CLNSIG value (dbSNP codes or ClinVar terms)'''
+    bits = 0
+    for term in value.replace('|', ',').replace('/', ',').split(','):
+        term = CLNSIG_CODES.get(term, term).replace('_', ' ').lower().strip()
+        if term in SIGNIFICANCE:
+            bits |= 1 << SIGNIFICANCE.index(term)
+    return bits
+
+
+def Filterbits(clinsignificance):
+    '''Returns the clinical significance bits a variant needs to pass the filter, 0 for no filtering'''
+    if not clinsignificance or clinsignificance == 'No Filtering':
+        return 0
+    if clinsignificance in SIGNIFICANCE:
+        return 1 << SIGNIFICANCE.index(clinsignificance)
+    # combined classes of the GUI filter, e.g. 'pathogenic likely pathogenic'
+    bits = 0
+    for term in SIGNIFICANCE:
+        if clinsignificance.startswith(term) or clinsignificance.endswith(term):
+            bits |= 1 << SIGNIFICANCE.index(term)
+    if not bits:
+        raise ValueError(f'Unknown clinical significance: {clinsignificance}')
+    return bits
+
+
+def Minorfrequency(info, alleles):
+    '''Returns the minor allele frequency from the CAF (dbSNP), FREQ (dbSNP, 1000Genomes first)
+            or AF (1000 Genomes) INFO field of a VCF line, nan if it has none'''
+    freqs = None
+    for item in info.split(';'):
+        key, _, value = item.partition('=')
+        if key == 'CAF':
+            freqs = value.split(',')
+        elif key == 'FREQ' and freqs is None:
+            studies = dict(study.split(':', 1) for study in value.split('|') if ':' in study)
+            value = studies.get('1000Genomes') or next(iter(studies.values()), None)
+            freqs = value.split(',') if value else None
+        elif key == 'AF' and freqs is None:
+            alternatives = [float(f) for f in value.split(',') if f not in ('.', '')]
+            freqs = [str(1 - sum(alternatives))] + [str(f) for f in alternatives]
+    freqs = sorted((float(f) for f in (freqs or []) if f not in ('.', '')), reverse=True)
+    if len(freqs) < 2 or len(freqs) > alleles:
+        return np.nan
+    return freqs[1]
+
+
+# Variant index class
+###########################################################################################
+class Variantindex():
+    '''Offline gene/region -> rsID index: gene intervals and the position sorted rsIDs of every
+    chromosome with their minor allele frequency and clinical significance bits'''
+
+    def __init__(self, genes, chromosomes, offsets, positions, rsids, maf, significance):
+        self.genes = genes
+        self.chromosomes = [str(chromosome) for chromosome in chromosomes]
+        self.offsets = offsets
+        self.positions = positions
+        self.rsids = rsids
+        self.maf = maf
+        self.significance = significance
+
+    @classmethod
+    def build(cls, gtf, vcf, log=None):
+        '''Builds the index from a GTF/GFF3 gene file and a dbSNP or 1000 Genomes VCF (SNVs only)'''
+        genes = Readgenes(gtf)
+        # typed arrays of the columns, a list of boxed ints and floats takes many GB for dbSNP
+        code = {}
+        codes, positions, rsids = array('H'), array('q'), array('q')
+        maf, significance = array('f'), array('H')
+        with Openfile(vcf) as handle:
+            for n, line in enumerate(handle):
+                if line.startswith('#'):
+                    continue
+                fields = line.rstrip('\n').split('\t', 8)
+                alternatives = fields[4].split(',')
+                if len(fields[3]) != 1 or any(len(alternative) != 1 for alternative in alternatives):
+                    continue
+                for rsid in fields[2].split(';'):
+                    if not rsid.startswith('rs'):
+                        continue
+                    codes.append(code.setdefault(Chromosome(fields[0]), len(code)))
+                    positions.append(int(fields[1]))
+                    rsids.append(int(rsid[2:]))
+                    maf.append(Minorfrequency(fields[7], len(alternatives) + 1))
+                    clnsig = [item[7:] for item in fields[7].split(';') if item.startswith('CLNSIG=')]
+                    significance.append(Significance(clnsig[0]) if clnsig else 0)
+                if log and n % 1000000 == 0:
+                    log(f'{n} lines')
+        names = sorted(code)
+        # the chromosome codes in the order of the sorted names
+        rank = np.empty(len(names), dtype=np.uint16)
+        rank[[code[name] for name in names]] = np.arange(len(names))
+        codes = rank[np.frombuffer(codes, dtype=np.uint16)]
+        positions = np.frombuffer(positions, dtype=np.int64)
+        order = np.lexsort((positions, codes))
+        offsets = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        return cls(genes, names, offsets, positions[order], np.frombuffer(rsids, dtype=np.int64)[order],
+                   np.frombuffer(maf, dtype=np.float32)[order], np.frombuffer(significance, dtype=np.uint16)[order])
+
+    def save(self, path):
+        names = sorted(self.genes)
+        np.savez(path, chromosomes=np.array(self.chromosomes), offsets=self.offsets,
+                 positions=self.positions, rsids=self.rsids, maf=self.maf, significance=self.significance,
+                 gene_names=np.array(names), gene_chromosomes=np.array([self.genes[g][0] for g in names]),
+                 gene_intervals=np.array([self.genes[g][1:] for g in names], dtype=np.int64).reshape(-1, 2))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        genes = {str(name): (str(chromosome), int(start), int(end)) for name, chromosome, (start, end)
+                 in zip(data['gene_names'], data['gene_chromosomes'], data['gene_intervals'])}
+        return cls(genes, data['chromosomes'], data['offsets'], data['positions'], data['rsids'],
+                   data['maf'], data['significance'])
+
+    def region(self, chromosome, start=None, end=None):
+        '''Returns the slice of the index arrays holding a chromosome or the region of it'''
+        chromosome = Chromosome(str(chromosome))
+        if chromosome not in self.chromosomes:
+            return slice(0, 0)
+        c = self.chromosomes.index(chromosome)
+        first, last = self.offsets[c], self.offsets[c + 1]
+        if start is not None:
+            positions = self.positions[first:last]
+            first, last = (first + np.searchsorted(positions, start, side='left'),
+                           first + np.searchsorted(positions, end, side='right'))
+        return slice(first, last)
+
+    def search(self, gene, clinsignificance='No Filtering', common=False):
+        '''Input = gene name/chromosome/region, clinical significance filter and the common variants filter
+                Output = the sorted rsID numbers, with the same filters as the dbSNP esearch term'''
+        kind, value = Snpcore.Parsequery(gene)
+        if kind == 'gene':
+            if value.upper() not in self.genes:
+                return np.array([], dtype=np.int64)
+            span = self.region(*self.genes[value.upper()])
+        elif kind == 'chromosome':
+            span = self.region(value)
+        elif kind == 'region':
+            span = self.region(*value)
+        else:
+            span = slice(0, len(self.rsids))
+        maf = self.maf[span]
+        if common:
+            keep = (maf >= COMMON_MAF[0]) & (maf <= COMMON_MAF[1])
+        else:
+            keep = maf > 0
+        bits = Filterbits(clinsignificance)
+        if bits:
+            keep &= (self.significance[span] & bits) == bits
+        return np.unique(self.rsids[span][keep])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build the offline gene/region -> SNP index used instead of the NCBI esearch.')
+    parser.add_argument('--gtf', required=True, help='GTF or GFF3 gene annotation (e.g. Ensembl Homo_sapiens.GRCh38.gtf.gz)')
+    parser.add_argument('--vcf', required=True, help='dbSNP or 1000 Genomes VCF with the rsIDs, their frequencies and CLNSIG')
+    parser.add_argument('-o', '--output', required=True, help='index file (.npz)')
+    args = parser.parse_args(argv)
+    index = Variantindex.build(args.gtf, args.vcf,
+                               lambda text: print(text, file=sys.stderr))
+    index.save(args.output)
+    print(f'{len(index.genes)} genes, {len(index.rsids)} SNPs', file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import threading
+
+
+# Constants
+###########################################################################################
+# Bytes read at a time from a response, cancellation is checked between reads
+CHUNK_BYTES = 65536
+# Seconds between the cancellation checks of a job waiting for its batches
+POLL = 0.2
+# Files of a checkpoint folder
+MANIFEST = 'manifest.json'
+JOURNAL = 'journal.jsonl'
+VERSION = 1
+
+
+class Cancelled(Exception):
+    '''Raised in the thread running a job once the job was cancelled'''
+
+
+# Job class
+###########################################################################################
+class Job():
+    '''Progress and cooperative cancellation of a long retrieval. The fetchers check it between
+    batches, pages and response chunks, and cancel() closes the responses being read.
+    progress (optional) is called with the status dict every time the job reports'''
+
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.responses = set()
+        self.batches = 0
+        self.total_batches = 0
+        self.variants = 0
+        self.total_variants = 0
+        self.received = 0
+        self.started = time.monotonic()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def cancel(self):
+        '''Stops the job: no new requests are sent and the ones being read are aborted'''
+        self.event.set()
+        with self.lock:
+            responses = list(self.responses)
+        for response in responses:
+            response.close()
+
+    def check(self):
+        '''Raises Cancelled if the job was cancelled'''
+        if self.event.is_set():
+            raise Cancelled()
+
+    def sleep(self, seconds):
+        '''Waits for seconds, raising Cancelled as soon as the job is cancelled'''
+        if self.event.wait(seconds):
+            raise Cancelled()
+
+    def chunks(self, response):
+        '''Yields the body of a streamed response chunk by chunk, counting the bytes received'''
+        with self.lock:
+            self.responses.add(response)
+        try:
+            for chunk in response.iter_content(CHUNK_BYTES):
+                self.check()
+                with self.lock:
+                    self.received += len(chunk)
+                yield chunk
+        except Cancelled:
+            raise
+        except Exception:
+            # a response closed by cancel() fails in whatever way the connection does
+            self.check()
+            raise
+        finally:
+            with self.lock:
+                self.responses.discard(response)
+
+    def read(self, response):
+        '''Reads the whole body of a streamed response through chunks()'''
+        return b''.join(self.chunks(response))
+
+    def add(self, batches=0, variants=0):
+        '''Adds work to the totals the progress is measured against'''
+        with self.lock:
+            self.total_batches += batches
+            self.total_variants += variants
+
+    def advance(self, batches=0, variants=0):
+        '''Counts the batches and variants done'''
+        with self.lock:
+            self.batches += batches
+            self.variants += variants
+
+    def status(self):
+        '''Output = dict of the batches and variants done and in total, the bytes received,
+                the seconds elapsed and the estimated seconds left (None until a batch is done)'''
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            eta = None
+            if self.batches and self.total_batches >= self.batches:
+                eta = elapsed / self.batches * (self.total_batches - self.batches)
+            return {'batches': self.batches, 'total_batches': self.total_batches,
+                    'variants': self.variants, 'total_variants': self.total_variants,
+                    'bytes': self.received, 'elapsed': elapsed, 'eta': eta}
+
+    def report(self):
+        if self.progress:
+            self.progress(self.status())
+
+
+def Statustext(status):
+    '''Returns a one line description of a job status'''
+    text = f"{status['variants']}/{status['total_variants']} SNPs"
+    if status['total_batches']:
+        text += f", {status['batches']}/{status['total_batches']} batches"
+    text += f", {status['bytes'] / 1e6:.1f} MB"
+    if status['eta'] is not None:
+        minutes, seconds = divmod(int(status['eta']), 60)
+        text += f', {minutes}:{seconds:02d} left'
+    return text
+
+
+# Checkpoint class
+###########################################################################################
+class Checkpoint():
+    '''Folder keeping the finished parts of a job on disk so a failed or stopped job resumes where it stopped.
+    manifest.json holds the settings of the job's searches; journal.jsonl gets one line appended per
+    finished esearch page (the query, its UIDs and number of hits), per few records of an Ensembl batch
+    as they are decoded (the endpoint and the records) and per finished batch (the endpoint and the rsIDs requested).
+    Only the records of finished batches are used again.
+    A journal line cut short by a crash is dropped when the checkpoint is opened again.'''
+
+    def __init__(self, folder, settings=None):
+        self.folder = folder
+        self.manifest = os.path.join(folder, MANIFEST)
+        self.journal = os.path.join(folder, JOURNAL)
+        self.settings = settings or {}
+        self.pages = {}
+        self.batches = {}
+        self.records = {}
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        if os.path.exists(self.manifest):
+            with open(self.manifest) as handle:
+                saved = json.load(handle)['settings']
+            if saved != json.loads(json.dumps(self.settings)):
+                raise ValueError(f'{folder} is the checkpoint of a different job: {saved}')
+        else:
+            temporary = self.manifest + '.tmp'
+            with open(temporary, 'w') as handle:
+                json.dump({'version': VERSION, 'settings': self.settings}, handle)
+            os.replace(temporary, self.manifest)
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.journal):
+            return
+        with open(self.journal, 'rb') as handle:
+            data = handle.read()
+        end = 0
+        for line in data.split(b'\n')[:-1]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            end += len(line) + 1
+            if entry['kind'] == 'page':
+                self.pages.setdefault(entry['query'], []).append((entry['ids'], entry['count']))
+                continue
+            self.records.setdefault(entry['ext'], {}).update(entry.get('records', {}))
+            if entry['kind'] == 'batch':
+                self.batches.setdefault(entry['ext'], []).append(entry['ids'])
+        if end < len(data):
+            with open(self.journal, 'r+b') as handle:
+                handle.truncate(end)
+
+    def append(self, entry):
+        '''Appends an entry to the journal'''
+        self.write(json.dumps(entry))
+
+    def write(self, line):
+        '''Appends a line of json to the journal and flushes it to disk'''
+        line += '\n'
+        with self.lock:
+            with open(self.journal, 'a', encoding='utf-8') as handle:
+                handle.write(line)
+                handle.flush()
+                os.fsync(handle.fileno())
+
+    def searched(self, query):
+        '''Returns the (UIDs, number of hits) pages of query already retrieved'''
+        return list(self.pages.get(query, []))
+
+    def addpage(self, query, ids, count):
+        self.pages.setdefault(query, []).append((list(ids), count))
+        self.append({'kind': 'page', 'query': query, 'count': count, 'ids': list(ids)})
+
+    def fetched(self, ext, rsids):
+        '''Output = the rsIDs already requested from the ext endpoint and the records of their batches'''
+        wanted = set(rsids)
+        done = set()
+        for ids in self.batches.get(ext, []):
+            done.update(wanted.intersection(ids))
+        records = self.records.get(ext, {})
+        # the records added since the checkpoint was opened are kept as their json text
+        return done, {rsid: json.loads(records[rsid]) if isinstance(records[rsid], str) else records[rsid]
+                      for rsid in done if rsid in records}
+
+    def addrecords(self, ext, decoded, encoded=False):
+        '''Saves records of a batch being fetched, with encoded they are json texts (as the Ensembl response had them)'''
+        self.records.setdefault(ext, {}).update(decoded)
+        if not encoded:
+            self.append({'kind': 'records', 'ext': ext, 'records': decoded})
+            return
+        # line breaks can only be json whitespace there, they would split the journal line
+        records = ', '.join(json.dumps(rsid) + ': ' + text.replace('\n', ' ').replace('\r', ' ')
+                            for rsid, text in decoded.items())
+        head = json.dumps({'kind': 'records', 'ext': ext})
+        self.write(head[:-1] + ', "records": {' + records + '}}')
+
+    def addbatch(self, ext, ids):
+        '''Marks a batch as finished, once all its records were saved by addrecords'''
+        self.batches.setdefault(ext, []).append(list(ids))
+        self.append({'kind': 'batch', 'ext': ext, 'ids': list(ids)})
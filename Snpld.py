@@ -0,0 +1,157 @@
+import os
+import sys
+import csv
+import argparse
+import numpy as np
+import Snpvcf
+
+
+# Constants
+###########################################################################################
+# SNPs per block of the pairwise products, bounds the memory of thousands of SNPs
+BLOCK = 512
+# Decimals of the written matrices (as LDlink)
+DECIMALS = 3
+MEASURES = ['r2', 'd']
+DEFAULT_POPULATIONS = ['ALL', 'AFR', 'AMR', 'EAS', 'EUR', 'SAS']
+
+
+# Haplotype matrix functions
+###########################################################################################
+
+def Phasedcalls(source, rsids):
+    '''Reads the phased genotypes of the rsIDs from a Snpvcf.Vcfsource
+            Output = the rsIDs found sorted by position, their alleles (reference first) and the
+            (haplotypes, SNPs) int16 matrix of allele indexes, one row per sample haplotype'''
+    nsamples = len(source.samples)
+    fields = {rsid: line.split('\t', 9) for rsid, line in source.Lines(rsids).items()}
+    found = sorted(fields, key=lambda rsid: (fields[rsid][0], int(fields[rsid][1])))
+    calls = np.zeros((nsamples, 2, len(found)), dtype=np.int16)
+    for snp, rsid in enumerate(found):
+        calls[:, :, snp] = Snpvcf.Parsegenotypes(fields[rsid][9], nsamples, fields[rsid][8] == 'GT')
+    alleles = [[fields[rsid][3]] + fields[rsid][4].split(',') for rsid in found]
+    # sample by sample haplotype rows: (samples, 2, SNPs) -> (2 * samples, SNPs)
+    return found, alleles, calls.reshape(2 * nsamples, len(found))
+
+
+def Haplotypes(source, rsids):
+    '''Output = the rsIDs found sorted by position, the (haplotypes, SNPs) alternative allele matrix
+            and the (haplotypes, SNPs) matrix of the called alleles'''
+    found, alleles, calls = Phasedcalls(source, rsids)
+    return found, (calls == 1).astype(np.float32), (calls >= 0).astype(np.float32)
+
+
+def Populationweights(source, populations):
+    '''Returns the (populations, haplotypes) membership matrix of the 1000 Genomes populations (e.g. EUR)
+            or custom groups of the source'''
+    rows = []
+    for population in populations:
+        for name in (population, f'{Snpvcf.PHASE3}:{population}', Snpvcf.GROUP_PREFIX + population):
+            if name in source.populations:
+                rows.append(source.membership[source.populations.index(name)])
+                break
+        else:
+            raise ValueError(f'Unknown population {population}')
+    return np.repeat(np.array(rows, dtype=np.float32), 2, axis=1)
+
+
+# LD functions
+###########################################################################################
+
+def Ldmatrices(alternative, called, weights, block=BLOCK):
+    '''Computes the pairwise r2 and |D'| of all the SNPs for every population in blocks of SNPs.
+            Each block pair takes one matrix product covering all the populations at once. With missing
+            calls the haplotypes missing either SNP are left out of that pair, which takes three more products.
+            Output = (populations, SNPs, SNPs) r2 and D' arrays, nan where a SNP is monomorphic'''
+    nsnps = alternative.shape[1]
+    complete = bool(called.all())
+    if complete:
+        total = weights.sum(axis=1)[:, None, None]
+        frequency = (weights @ alternative) / weights.sum(axis=1)[:, None]
+    r2 = np.full((len(weights), nsnps, nsnps), np.nan, dtype=np.float32)
+    dprime = np.full((len(weights), nsnps, nsnps), np.nan, dtype=np.float32)
+    for i in range(0, nsnps, block):
+        rows = slice(i, min(i + block, nsnps))
+        # (populations, haplotypes, block) weighted haplotypes of the row block
+        weighted = weights[:, :, None] * alternative[None, :, rows]
+        weightedcalled = None if complete else weights[:, :, None] * called[None, :, rows]
+        for j in range(i, nsnps, block):
+            columns = slice(j, min(j + block, nsnps))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                if complete:
+                    pi = frequency[:, rows, None]
+                    pj = frequency[:, None, columns]
+                    pij = (weighted.transpose(0, 2, 1) @ alternative[:, columns]) / total
+                else:
+                    n = weightedcalled.transpose(0, 2, 1) @ called[:, columns]
+                    pi = (weighted.transpose(0, 2, 1) @ called[:, columns]) / n
+                    pj = (weightedcalled.transpose(0, 2, 1) @ alternative[:, columns]) / n
+                    pij = (weighted.transpose(0, 2, 1) @ alternative[:, columns]) / n
+                d = pij - pi * pj
+                variance = pi * (1 - pi) * pj * (1 - pj)
+                blockr2 = np.where(variance > 0, d * d / variance, np.nan)
+                dmax = np.where(d > 0, np.minimum(pi * (1 - pj), (1 - pi) * pj),
+                                np.minimum(pi * pj, (1 - pi) * (1 - pj)))
+                blockd = np.where(variance > 0, np.abs(d) / dmax, np.nan)
+            r2[:, rows, columns] = np.clip(blockr2, 0, 1)
+            dprime[:, rows, columns] = np.clip(blockd, 0, 1)
+            r2[:, columns, rows] = r2[:, rows, columns].transpose(0, 2, 1)
+            dprime[:, columns, rows] = dprime[:, rows, columns].transpose(0, 2, 1)
+    return r2, dprime
+
+
+def Writematrix(path, rsids, matrix, decimals=DECIMALS):
+    '''Writes a matrix as csv in the LDlink LDmatrix layout: an RS_number column followed by one column per rsID'''
+    with open(path, 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['RS_number'] + list(rsids))
+        for rsid, values in zip(rsids, np.round(matrix.astype(np.float64), decimals)):
+            writer.writerow([rsid] + ['NA' if np.isnan(value) else value for value in values])
+
+
+def Ldfiles(source, rsids, populations=DEFAULT_POPULATIONS, measures=MEASURES, folder='.'):
+    '''Computes the LD of the rsIDs for all the populations and writes one <measure>_<population>.csv
+            matrix per population and measure to folder
+            Output = the rsIDs found in the VCFs, in position order'''
+    found, alternative, called = Haplotypes(source, rsids)
+    r2, dprime = Ldmatrices(alternative, called,
+                            Populationweights(source, populations))
+    os.makedirs(folder, exist_ok=True)
+    for p, population in enumerate(populations):
+        for measure, matrices in (('r2', r2), ('d', dprime)):
+            if measure in measures:
+                Writematrix(os.path.join(folder, f'{measure}_{population}.csv'), found, matrices[p])
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compute r2 and D\' LD matrices of SNPs from local phased 1000 Genomes VCFs.')
+    parser.add_argument('rsids', nargs='+')
+    parser.add_argument('--populations', nargs='*', default=DEFAULT_POPULATIONS,
+                        help='1000 Genomes populations (e.g. EUR, TSI) and/or custom groups')
+    parser.add_argument('--measures', nargs='*', default=MEASURES, choices=MEASURES)
+    parser.add_argument('--vcf', nargs='*',
+                        help='bgzipped, tabix indexed VCFs or folders of them (default: SNPOP_VCF)')
+    parser.add_argument('--panel', default=os.environ.get('SNPOP_PANEL'),
+                        help='1000 Genomes sample panel file (default: SNPOP_PANEL)')
+    parser.add_argument('--groups', default=os.environ.get('SNPOP_GROUPS'),
+                        help='custom population groups file (default: SNPOP_GROUPS)')
+    parser.add_argument('-o', '--output', default='.', help='folder the matrices are written to')
+    args = parser.parse_args(argv)
+    args.vcf = args.vcf or [path for path in os.environ.get('SNPOP_VCF', '').split(',') if path]
+    if not args.vcf or not args.panel:
+        parser.error('the VCFs and the panel are needed (--vcf/--panel or SNPOP_VCF/SNPOP_PANEL)')
+
+    source = Snpvcf.Vcfsource(args.vcf, args.panel)
+    if args.groups:
+        source.addgroups(Snpvcf.Readgroups(args.groups))
+    found = Ldfiles(source, args.rsids, args.populations, args.measures, args.output)
+    missing = sorted(set(args.rsids) - set(found))
+    if missing:
+        print(f'not in the VCFs: {" ".join(missing)}', file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+import os
+import numpy as np
+import pandas as pd
+import Snpcore
+import Snptrace
+
+
+# Constants
+###########################################################################################
+# Output formats by file extension, parquet and feather need pyarrow
+FORMATS = ['csv', 'parquet', 'feather']
+# Rows formatted at a time when writing csv
+CHUNK_ROWS = 20000
+# Text of the missing values in csv files, strings are always quoted and numbers never
+NA = 'NA'
+
+
+# Columnar store of the data table
+###########################################################################################
+
+def Numericcolumns(columns=None):
+    '''Returns the names of the numeric columns (position, allele and genotype frequencies) of the data table'''
+    columns = columns or Snpcore.Columns()
+    populations = (len(columns) - 10) // 5
+    frequencies = columns[5:5 + 2 * populations]
+    genotypes = columns[10 + 2 * populations:]
+    return [columns[2]] + frequencies + genotypes
+
+
+def Frame(rows, columns=None):
+    '''Creates the columnar store (pandas DataFrame) of the data table rows in one step,
+            with float32 frequency columns and a numeric position column'''
+    columns = columns or Snpcore.Columns()
+    numeric = set(Numericcolumns(columns))
+    with Snptrace.span('frame', rows=len(rows)):
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        data = {}
+        for column, value in zip(columns, values):
+            if column == columns[2]:
+                data[column] = pd.to_numeric(pd.Series(value, dtype=object), errors='coerce')
+            elif column in numeric:
+                data[column] = np.array(value, dtype=np.float32)
+            else:
+                data[column] = pd.Series(value, dtype=object)
+        return pd.DataFrame(data, columns=columns)
+
+
+def Storeframe(store, rsids=None, columns=None):
+    '''Creates the data table frame straight from the typed columns of a Snpcore.Recordstore,
+            by default of every record sorted by rsID'''
+    columns = columns or Snpcore.Columns(store.populations)
+    with Snptrace.span('frame', rows=len(store)) as span:
+        values = store.table(rsids)
+        span.set(rows=len(values[0]))
+        data = {}
+        for column, value in zip(columns, values):
+            if column == columns[2]:
+                # unknown positions (-1) make the column float like pd.to_numeric does in Frame
+                data[column] = value if (value >= 0).all() else np.where(value >= 0, value, np.nan)
+            elif value.dtype == object:
+                data[column] = pd.Series(value, dtype=object)
+            else:
+                data[column] = value
+        return pd.DataFrame(data, columns=columns)
+
+
+# Text of a table value, shared with the csv writer of Snpcore
+Celltext = Snpcore.Celltext
+
+
+def Getframe(UIDlist, batch_size=None, inflight=None, callback=None, job=None):
+    '''Retrieves the data table of the UIDs as a columnar store,
+            callback (optional) gets the rows of the SNPs completed by each batch'''
+    return Storeframe(Snpcore.Getstore(UIDlist, batch_size, inflight, callback=callback, job=job))
+
+
+def Append(frame, rows):
+    '''Returns the frame with the rows added at the end'''
+    if not len(frame):
+        return Frame(rows, list(frame.columns))
+    return pd.concat([frame, Frame(rows, list(frame.columns))], ignore_index=True)
+
+
+# Export functions
+###########################################################################################
+
+def Quoted(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+def Writecsv(frame, sink, chunk_size=CHUNK_ROWS):
+    '''Streams the frame to a csv file (path or binary file object) chunk_size rows at a time,
+            with pyarrow's csv writer when installed. Both writers quote the strings and write NA for missing values'''
+    text = [column for column in frame.columns
+            if not pd.api.types.is_numeric_dtype(frame[column])]
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        pa = None
+    if pa is None:
+        # the same cells as pyarrow: decimals of the float32 values (Celltext) and quoted strings
+        handle = open(sink, 'wb') if isinstance(sink, str) else sink
+        try:
+            handle.write((','.join(Quoted(column) for column in frame.columns) + '\n').encode())
+            for start in range(0, len(frame), chunk_size):
+                chunk = frame.iloc[start:start + chunk_size]
+                cells = [[NA if value is None or value != value else Quoted(str(value))
+                          for value in chunk[column].tolist()] if column in text else
+                         [Snpcore.Celltext(value) for value in chunk[column].to_numpy()]
+                         for column in frame.columns]
+                handle.write(''.join(','.join(row) + '\n' for row in zip(*cells)).encode())
+        finally:
+            if handle is not sink:
+                handle.close()
+        return
+    writer = None
+    options = pacsv.WriteOptions(null_string=NA)
+    for start in range(0, max(len(frame), 1), chunk_size):
+        chunk = frame.iloc[start:start + chunk_size]
+        chunk = chunk.assign(**{column: chunk[column].astype(str).where(chunk[column].notna(), None)
+                                for column in text})
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pacsv.CSVWriter(sink, table.schema, write_options=options)
+        writer.write_table(table)
+    writer.close()
+
+
+def Export(frame, path):
+    '''Writes the data table frame to path in the format of its extension (csv, parquet or feather)'''
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    with Snptrace.span('export', rows=len(frame), format=extension) as span:
+        if extension == 'parquet':
+            frame.to_parquet(path, index=False)
+        elif extension == 'feather':
+            frame.reset_index(drop=True).to_feather(path)
+        else:
+            Writecsv(frame, path)
+        span.set(bytes=os.path.getsize(path))
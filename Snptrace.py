@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+
+
+# Constants
+###########################################################################################
+# Environment variable with the trace file, turns the tracing on for the GUI and the command line
+ENV = 'SNPOP_TRACE'
+# Counters summed per stage in the report
+COUNTERS = ['bytes', 'rows']
+
+
+# Span classes
+###########################################################################################
+class Span():
+    '''Times one run of a stage, the counters given or set() are kept with it'''
+
+    __slots__ = ('tracer', 'name', 'args', 'concurrent', 'start')
+
+    def __init__(self, tracer, name, args, concurrent=False):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.concurrent = concurrent
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.add(self.name, self.start, time.perf_counter(), self.args, self.concurrent)
+        return False
+
+    def set(self, **args):
+        self.args.update(args)
+
+
+class Nospan():
+    '''The span handed out while tracing is off, it records nothing'''
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NOSPAN = Nospan()
+
+
+# Tracer class
+###########################################################################################
+class Tracer():
+    '''Collects the spans of the pipeline stages (esearch, cache, ensembl, decode, parse, vcf, table, render, export)
+    and writes them as a Chrome trace / Perfetto json file with a per stage summary'''
+
+    def __init__(self, path=None):
+        self.path = path
+        self.spans = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def add(self, name, start, end, args, concurrent=False):
+        with self.lock:
+            self.spans.append((name, start, end, threading.get_ident(), args, concurrent))
+
+    def events(self):
+        '''Returns the spans as Chrome trace events, in microseconds since the tracer started.
+                Spans overlapping on one thread (asyncio requests) are written as async events'''
+        pid = os.getpid()
+        events = []
+        for n, (name, start, end, thread, args, concurrent) in enumerate(list(self.spans)):
+            ts = (start - self.origin) * 1e6
+            if concurrent:
+                events.append({'name': name, 'cat': name, 'ph': 'b', 'id': n, 'ts': ts, 'pid': pid,
+                               'tid': thread, 'args': args})
+                events.append({'name': name, 'cat': name, 'ph': 'e', 'id': n,
+                               'ts': (end - self.origin) * 1e6, 'pid': pid, 'tid': thread})
+            else:
+                events.append({'name': name, 'cat': name, 'ph': 'X', 'ts': ts, 'dur': (end - start) * 1e6,
+                               'pid': pid, 'tid': thread, 'args': args})
+        return events
+
+    def write(self, path=None):
+        '''Writes the Chrome trace json, which chrome://tracing and ui.perfetto.dev open'''
+        with open(path or self.path, 'w') as handle:
+            json.dump({'traceEvents': self.events(), 'displayTimeUnit': 'ms'}, handle)
+
+    def summary(self):
+        '''Output = dict of stage -> number of spans, total/mean/max seconds and the summed counters'''
+        stages = {}
+        for name, start, end, thread, args, concurrent in list(self.spans):
+            stage = stages.setdefault(name, dict({'spans': 0, 'total': 0.0, 'max': 0.0},
+                                                 **{counter: 0 for counter in COUNTERS}))
+            stage['spans'] += 1
+            stage['total'] += end - start
+            stage['max'] = max(stage['max'], end - start)
+            for counter in COUNTERS:
+                stage[counter] += args.get(counter, 0)
+        for stage in stages.values():
+            stage['mean'] = stage['total'] / stage['spans']
+        return stages
+
+    def report(self):
+        '''Returns the summary as a text table, stages ordered by their total time'''
+        wall = max((end for _, _, end, _, _, _ in self.spans), default=self.origin) - self.origin
+        lines = [f"{'stage':<10}{'spans':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}{'MB':>9}{'rows':>9}"]
+        for name, stage in sorted(self.summary().items(), key=lambda item: -item[1]['total']):
+            lines.append(f"{name:<10}{stage['spans']:>8}{stage['total']:>10.3f}{stage['mean'] * 1e3:>10.2f}"
+                         f"{stage['max'] * 1e3:>10.2f}{stage['bytes'] / 1e6:>9.2f}{stage['rows']:>9}")
+        lines.append(f'wall time {wall:.3f} s (stages running at the same time add up to more)')
+        return '\n'.join(lines)
+
+    def finish(self, handle=None):
+        '''Writes the trace file and the report'''
+        if self.path:
+            self.write()
+        print(self.report(), file=handle or sys.stderr)
+
+
+TRACER = None
+
+
+def enable(path=None):
+    '''Turns the tracing on, the trace is written to path (optional) and the report printed
+            by finish(), at the latest when the program exits'''
+    global TRACER
+    TRACER = Tracer(path)
+    atexit.register(finish)
+    return TRACER
+
+
+def span(name, concurrent=False, **args):
+    '''Returns a context manager timing a run of the stage name (a no-op while the tracing is off).
+            concurrent marks spans that overlap others on the same thread, e.g. asyncio requests.'''
+    if TRACER is None:
+        return NOSPAN
+    return Span(TRACER, name, args, concurrent)
+
+
+def finish(handle=None):
+    '''Writes the trace and the report of the spans so far and turns the tracing off'''
+    global TRACER
+    if TRACER is not None:
+        tracer, TRACER = TRACER, None
+        tracer.finish(handle)
+
+
+if os.environ.get(ENV):
+    enable(os.environ[ENV])
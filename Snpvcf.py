@@ -0,0 +1,270 @@
+import os
+import glob
+import threading
+import numpy as np
+import pysam
+import Snpcore
+import Snptrace
+
+
+# Constants
+###########################################################################################
+# Prefix of the Ensembl names of the 1000 Genomes phase 3 populations
+PHASE3 = '1000GENOMES:phase_3'
+# Ensembl options of the record parts the VCFs provide
+EXT = '/variation/homo_sapiens?pops=1&population_genotypes=1'
+# Suffix of the rsID index written next to each VCF
+INDEX_SUFFIX = '.rsidx.npz'
+# Allele index of missing calls and of the absent second allele of haploid calls
+MISSING = -1
+HAPLOID = -2
+# VCF lines whose genotype matrix is counted at a time
+CHUNK_LINES = 64
+# Prefix of the population names of the custom groups
+GROUP_PREFIX = 'group:'
+
+
+# Panel and genotype parsing functions
+###########################################################################################
+
+def Readpanel(path):
+    '''Reads the 1000 Genomes sample panel (sample, pop, super_pop, gender columns)
+            Output = dict of Ensembl population name -> list of samples, including ALL'''
+    populations = {f'{PHASE3}:ALL': []}
+    with open(path) as handle:
+        for line in handle:
+            fields = line.split()
+            if not fields or fields[0] == 'sample':
+                continue
+            sample = fields[0]
+            populations[f'{PHASE3}:ALL'].append(sample)
+            for population in fields[1:3]:
+                populations.setdefault(
+                    f'{PHASE3}:{population}', []).append(sample)
+    return populations
+
+
+def Readgroups(path):
+    '''Reads the custom population groups, one per line: the group name followed by its members
+            (samples and/or 1000 Genomes populations, e.g. TSI+IBS TSI IBS), separated by spaces or commas
+            Output = dict of group name -> list of members'''
+    groups = {}
+    with open(path) as handle:
+        for line in handle:
+            fields = line.split('#')[0].replace(',', ' ').split()
+            if fields:
+                groups.setdefault(fields[0], []).extend(fields[1:])
+    return groups
+
+
+def Parsegenotypes(samples, nsamples, gtonly=True):
+    '''Parses the sample columns of a VCF line
+            Output = (nsamples, 2) int16 array of allele indexes, MISSING for no call and HAPLOID
+            for the absent second allele of haploid calls'''
+    data = samples.rstrip('\n').encode()
+    # fast path: every call is a diploid single digit genotype (e.g. 0|1) and GT is the only field
+    if gtonly and len(data) == 4 * nsamples - 1:
+        calls = np.frombuffer(data + b'\t', dtype=np.uint8).reshape(nsamples, 4)
+        alleles = calls[:, [0, 2]].astype(np.int16) - ord('0')
+        alleles[calls[:, [0, 2]] == ord('.')] = MISSING
+        return alleles
+    alleles = np.full((nsamples, 2), HAPLOID, dtype=np.int16)
+    for i, call in enumerate(samples.rstrip('\n').split('\t')):
+        for j, allele in enumerate(call.split(':')[0].replace('/', '|').split('|')[:2]):
+            alleles[i, j] = MISSING if allele == '.' else int(allele)
+    return alleles
+
+
+# VCF data source class
+###########################################################################################
+class Vcfsource():
+    '''Local source of the pops=1 and population_genotypes=1 parts of the Ensembl variation records,
+    computed from bgzipped, tabix indexed 1000 Genomes VCFs and the sample panel'''
+
+    def __init__(self, paths, panel):
+        self.files = []
+        for path in ([paths] if isinstance(paths, str) else paths):
+            if os.path.isdir(path):
+                self.files += sorted(glob.glob(os.path.join(path, '*.vcf.gz')))
+            else:
+                self.files.append(path)
+        if not self.files:
+            raise ValueError(f'no VCF files in {paths}')
+        self.handles = [pysam.TabixFile(path) for path in self.files]
+        self.lock = threading.Lock()
+        self.ext = EXT
+        self.samples = self.handles[0].header[-1].split('\t')[9:]
+        self.panel = Readpanel(panel)
+        self.setpopulations(self.panel)
+        self.indexes = [self.Rsindex(i) for i in range(len(self.files))]
+
+    def setpopulations(self, populations):
+        '''Sets the populations (name -> list of samples) as the rows of the sample membership matrix'''
+        position = {sample: i for i, sample in enumerate(self.samples)}
+        self.populations = list(populations)
+        self.membership = np.zeros(
+            (len(populations), len(self.samples)), dtype=np.float32)
+        for row, samples in enumerate(populations.values()):
+            self.membership[row, [position[sample]
+                                  for sample in samples if sample in position]] = 1
+
+    def addgroups(self, groups):
+        '''Adds custom groups (name -> samples and/or 1000 Genomes populations) as extra rows of the
+                membership matrix, so their frequencies come out of the same products as the panel populations
+                Output = the (population, column label) pairs of the groups'''
+        populations = {name: self.membership[row] for row, name in enumerate(self.populations)}
+        position = {sample: i for i, sample in enumerate(self.samples)}
+        added = []
+        for name, members in groups.items():
+            row = np.zeros(len(self.samples), dtype=np.float32)
+            for member in members:
+                population = member if member in populations else f'{PHASE3}:{member}'
+                if population in populations:
+                    row = np.maximum(row, populations[population])
+                elif member in position:
+                    row[position[member]] = 1
+                else:
+                    raise ValueError(f'Unknown sample or population {member} in group {name}')
+            populations[GROUP_PREFIX + name] = row
+            added.append((GROUP_PREFIX + name, name))
+        self.populations = list(populations)
+        self.membership = np.array(list(populations.values()), dtype=np.float32)
+        return added
+
+    def Rsindex(self, i):
+        '''Loads, or builds once by scanning the VCF, the sorted rsID -> (contig, position) index of file i'''
+        path = self.files[i] + INDEX_SUFFIX
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(self.files[i]):
+            index = np.load(path)
+            return index['rs'], index['contig'], index['position'], list(index['contigs'])
+        contigs = list(self.handles[i].contigs)
+        rs, contig, position = [], [], []
+        for c, name in enumerate(contigs):
+            for line in self.handles[i].fetch(name):
+                fields = line.split('\t', 3)
+                for rsid in fields[2].split(';'):
+                    if rsid.startswith('rs'):
+                        rs.append(int(rsid[2:]))
+                        contig.append(c)
+                        position.append(int(fields[1]))
+        order = np.argsort(rs, kind='stable')
+        index = (np.array(rs, dtype=np.int64)[order], np.array(contig, dtype=np.int32)[order],
+                 np.array(position, dtype=np.int64)[order], contigs)
+        try:
+            np.savez(path, rs=index[0], contig=index[1],
+                     position=index[2], contigs=np.array(contigs))
+        except OSError:
+            pass
+        return index
+
+    def Records(self, lines):
+        '''Creates the pops and population_genotypes parts of the Ensembl records of VCF lines,
+                counting the alleles and genotypes of every population and group of the batch in one pass'''
+        records = []
+        for start in range(0, len(lines), CHUNK_LINES):
+            records += self.Chunkrecords(lines[start:start + CHUNK_LINES])
+        return records
+
+    def Chunkrecords(self, lines):
+        fields = [line.split('\t', 9) for line in lines]
+        alleles = [[f[3]] + f[4].split(',') for f in fields]
+        nalleles = max(len(a) for a in alleles)
+        # (variants, samples, 2) genotype matrix
+        calls = np.stack([Parsegenotypes(f[9], len(self.samples), f[8] == 'GT')
+                          for f in fields])
+        # allele counts of every sample -> allele counts of every population in one product
+        counts = np.zeros(calls.shape[:2] + (nalleles,), dtype=np.float32)
+        for allele in range(nalleles):
+            counts[:, :, allele] = (calls == allele).sum(axis=2)
+        allelecounts = self.membership @ counts
+        # unordered genotype codes, haploid calls after the diploid ones, no call = -1
+        codes = np.where(calls[:, :, 1] == HAPLOID, nalleles * nalleles + calls[:, :, 0],
+                         calls.min(axis=2) * nalleles + calls.max(axis=2))
+        codes[(calls[:, :, 0] < 0) | (calls[:, :, 1] == MISSING)] = -1
+        ncodes = nalleles * nalleles + nalleles
+        onehot = np.zeros(codes.shape + (ncodes,), dtype=np.float32)
+        variant, sample = np.nonzero(codes >= 0)
+        onehot[variant, sample, codes[variant, sample]] = 1
+        genotypecounts = self.membership @ onehot
+
+        records = []
+        for v, (f, names) in enumerate(zip(fields, alleles)):
+            populations = []
+            population_genotypes = []
+            present = np.flatnonzero(genotypecounts[v].any(axis=0))
+            genotypes = {code: names[code - nalleles * nalleles] if code >= nalleles * nalleles
+                         else f'{names[code // nalleles]}|{names[code % nalleles]}' for code in present}
+            for row, population in enumerate(self.populations):
+                total = allelecounts[v, row].sum()
+                if total:
+                    for allele, count in zip(names, allelecounts[v, row]):
+                        if count:
+                            populations.append({'population': population, 'allele': allele,
+                                                'allele_count': int(count), 'frequency': round(float(count) / float(total), 6)})
+                total = genotypecounts[v, row].sum()
+                if total:
+                    for code in present:
+                        count = genotypecounts[v, row, code]
+                        if count:
+                            population_genotypes.append({'population': population, 'genotype': genotypes[code],
+                                                         'count': int(count), 'frequency': round(float(count) / float(total), 6)})
+
+            # the minor allele is the second most frequent allele of all the samples
+            overall = counts[v].sum(axis=0)[:len(names)]
+            ranked = np.argsort(-overall, kind='stable')
+            minor = names[ranked[1]] if len(names) > 1 and overall[ranked[1]] else None
+            ancestral = None
+            for item in f[7].split(';'):
+                if item.startswith('AA='):
+                    ancestral = item[3:].split('|')[0].upper() or None
+            position = int(f[1])
+            records.append({'name': None, 'minor_allele': minor,
+                            'MAF': round(float(overall[ranked[1]] / overall.sum()), 6) if minor else None,
+                            'mappings': [{'location': f'{f[0]}:{position}-{position + len(f[3]) - 1}',
+                                          'seq_region_name': f[0], 'start': position,
+                                          'allele_string': '/'.join(names), 'ancestral_allele': ancestral}],
+                            'populations': populations, 'population_genotypes': population_genotypes})
+        return records
+
+    def get(self, rsids):
+        '''Returns the records of the rsIDs found in the VCFs'''
+        with Snptrace.span('vcf', ids=len(rsids)) as span:
+            found = self.Lines(rsids)
+            span.set(rows=len(found))
+            return {rsid: dict(record, name=rsid)
+                    for rsid, record in zip(found, self.Records(list(found.values())))}
+
+    def Lines(self, rsids):
+        '''Returns the VCF lines of the rsIDs found in the VCFs (rsID -> line)'''
+        numbers = np.array([int(str(rs).lower().strip('rs')) for rs in rsids], dtype=np.int64)
+        found = {}
+        with self.lock:
+            for handle, (rs, contig, position, contigs) in zip(self.handles, self.indexes):
+                hits = np.minimum(np.searchsorted(rs, numbers), len(rs) - 1)
+                for number, i in zip(numbers, hits):
+                    if i < 0 or rs[i] != number:
+                        continue
+                    rsid = f'rs{number}'
+                    # an rsID can be on more than one line, e.g. a SNP and an indel at the same position
+                    for j in range(i, np.searchsorted(rs, number, side='right')):
+                        for line in handle.fetch(contigs[contig[j]], position[j] - 1, position[j]):
+                            if rsid not in found and rsid in line.split('\t', 3)[2].split(';'):
+                                found[rsid] = line
+        return found
+
+    def stream(self, UIDlist, batch_size=None):
+        '''Yields the records found in the VCFs in batches of batch_size rsIDs'''
+        for batch in Snpcore.Batches(list(UIDlist), batch_size or Snpcore.BATCH_SIZE):
+            decoded = self.get(batch)
+            if decoded:
+                yield decoded
+
+
+def Defaultsource():
+    '''Creates the Vcfsource of the SNPOP_VCF (VCF files or folder, comma separated) and SNPOP_PANEL
+            environment variables, None when they are not set'''
+    paths = os.environ.get('SNPOP_VCF')
+    panel = os.environ.get('SNPOP_PANEL')
+    if not paths or not panel:
+        return None
+    return Vcfsource(paths.split(','), panel)
@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Snpcore
+
+
+# Synthetic population_genotypes=1 response
+###########################################################################################
+
+def Syntheticvariant(i, populations, multiallelic=False):
+    '''Creates a decoded Ensembl record with genotype frequencies for every population'''
+    rnd = random.Random(i)
+    alleles = rnd.sample('ACGT', 3 if multiallelic else 2)
+    minor = alleles[-1]
+    genotypes = [f'{a}|{b}' for n, a in enumerate(alleles) for b in alleles[n:]]
+    records = []
+    for population in populations:
+        weights = [rnd.random() for genotype in genotypes]
+        total = sum(weights)
+        for genotype, weight in zip(genotypes, weights):
+            records.append({'population': population, 'genotype': genotype,
+                            'frequency': weight / total, 'count': 1, 'subsnp_id': f'ss{i}'})
+    return {'name': f'rs{i}', 'minor_allele': minor, 'population_genotypes': records}
+
+
+def Genotypes(decoded, populations):
+    '''Parses the genotype frequencies of the records the way the record store does'''
+    columns = Snpcore.Populationcolumns(populations)
+    return [Snpcore.Genotypevalues(record, columns) for record in decoded.values()]
+
+
+def Legacygenotypeparser(decoded, populations):
+    '''The per population if-chain classifier Genotypevalues replaced, kept for comparison'''
+    keys = [f'{genotype}{pop}' for pop in populations for genotype in Snpcore.GENOTYPES]
+    Genotypelist = []
+    for uid in decoded:
+        gendict = {}
+        minorallele = decoded[uid]['minor_allele']
+        for items in decoded[uid]['population_genotypes']:
+            for pop in populations:
+                if items['population'] == pop:
+                    if (items['genotype'].split('|')[0] == minorallele or items['genotype'].split('|')[1] == minorallele) and not items['genotype'] == f'{minorallele}|{minorallele}':
+                        gendict[f'heterozygous{pop}'] = items['frequency']
+                    if items['genotype'] == f'{minorallele}|{minorallele}':
+                        gendict[f'minorhomozygous{pop}'] = items['frequency']
+                    if (items['genotype'].split('|')[0] != minorallele) and (items['genotype'].split('|')[1] != minorallele):
+                        gendict[f'majorhomozygous{pop}'] = items['frequency']
+            for items in keys:
+                if items not in gendict.keys():
+                    gendict[items] = 0
+        Genotypelist.append(gendict)
+    return Genotypelist
+
+
+def Timeit(function, repeat):
+    '''Returns the best time of repeat runs of function'''
+    best = float('inf')
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Micro-benchmark of the per variant cost of the genotype classifier.')
+    parser.add_argument('-n', '--variants', type=int, default=2000)
+    parser.add_argument('--populations', nargs='*', default=['1000G', '1000G-sub'])
+    parser.add_argument('--multiallelic', action='store_true')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--legacy', action='store_true',
+                        help='also time the replaced if-chain classifier')
+    args = parser.parse_args(argv)
+
+    populations = Snpcore.Populations(args.populations)
+    names = [population for population, label in populations]
+    decoded = {f'rs{i}': Syntheticvariant(i, names, args.multiallelic)
+               for i in range(1, args.variants + 1)}
+    print(f'{args.variants} variants, {len(names)} populations, '
+          f'{len(decoded["rs1"]["population_genotypes"])} genotype records per variant')
+
+    best = Timeit(lambda: Genotypes(decoded, populations), args.repeat)
+    print(f'Genotypevalues:       {best * 1e6 / args.variants:8.1f} us/variant')
+    if args.legacy:
+        legacy = Timeit(lambda: Legacygenotypeparser(decoded, names), args.repeat)
+        print(f'legacy if-chain:      {legacy * 1e6 / args.variants:8.1f} us/variant '
+              f'({legacy / best:.1f}x)')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Snpcore
+import Snphttp
+import Snptable
+import Snptrace
+
+
+# Constants
+###########################################################################################
+SIZES = [100, 1000, 10000, 100000]
+STAGES = ['esearch', 'ensembl', 'decode', 'parse', 'table', 'frame', 'render', 'export']
+STANDIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'standin.py')
+
+
+def Startstandin(options):
+    '''Runs standin.py in its own process (so it doesn't share the interpreter lock with the client)
+            Output = the process and its url'''
+    process = subprocess.Popen([sys.executable, STANDIN] + options, stdout=subprocess.PIPE, text=True)
+    return process, process.stdout.readline().strip()
+
+
+def Rendermodel():
+    '''Returns a Variantmodel of the GUI on an offscreen Qt application, None without PyQt5'''
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5 import QtWidgets
+    except ImportError:
+        return None
+    import Snpfinder
+    Rendermodel.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    return Snpfinder.Variantmodel(Snpcore.Columns())
+
+
+def Run(size, args, model, folder):
+    '''Searches size SNPs, retrieves their data, builds the table, renders and exports it
+            Output = dict of the seconds, throughput and per stage seconds of the run'''
+    tracer = Snptrace.TRACER = Snptrace.Tracer()
+    start = time.perf_counter()
+    UIDlist, count = Snpcore.all_SNV(f'8:1-{size}', 'No Filtering')
+    store = Snpcore.Getstore(UIDlist, args.batch_size, args.inflight)
+    frame = Snptable.Storeframe(store)
+    if model is not None:
+        model.setframe(frame)
+    Snptable.Export(frame, os.path.join(folder, f'{size}.{args.format}'))
+    seconds = time.perf_counter() - start
+    Snptrace.TRACER = None
+    summary = tracer.summary()
+    return {'variants': len(store), 'seconds': seconds, 'throughput': len(store) / seconds,
+            'stages': {stage: summary[stage]['total'] for stage in STAGES if stage in summary},
+            'bytes': summary.get('ensembl', {}).get('bytes', 0)}
+
+
+def Compare(results, baseline, tolerance):
+    '''Output = the regression messages of the sizes whose throughput dropped by more than tolerance'''
+    messages = []
+    for size, result in results.items():
+        if size in baseline:
+            ratio = result['throughput'] / baseline[size]['throughput']
+            if ratio < 1 - tolerance:
+                messages.append(f'{size} variants: {result["throughput"]:.0f} variants/s is '
+                                f'{(1 - ratio) * 100:.0f}% slower than the baseline')
+    return messages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='End-to-end throughput and per stage cost of the SNP retrieval against the local stand-in server.')
+    parser.add_argument('--sizes', nargs='*', type=int, default=SIZES, help='numbers of variants retrieved')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds of latency of every request')
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--throttle', type=float, default=0.0, help='fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--extra-populations', type=int, default=0, help='grows the payload of every record')
+    parser.add_argument('--recording', help='recorded responses to replay instead of synthetic ones')
+    parser.add_argument('--rate', type=float, default=1000, help='requests per second allowed to the stand-in')
+    parser.add_argument('--batch-size', type=int, default=Snpcore.BATCH_SIZE)
+    parser.add_argument('--inflight', type=int, default=Snpcore.MAX_INFLIGHT)
+    parser.add_argument('--format', default='csv', choices=Snptable.FORMATS, help='export format')
+    parser.add_argument('--no-render', action='store_true', help='skip the GUI table model (needs PyQt5)')
+    parser.add_argument('--json', help='file to save the results to, e.g. as a baseline')
+    parser.add_argument('--baseline', help='results of an earlier run (--json) to compare the throughput with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='throughput drop against the baseline reported as a regression')
+    args = parser.parse_args(argv)
+
+    options = ['--latency', str(args.latency), '--jitter', str(args.jitter), '--throttle', str(args.throttle),
+               '--retry-after', str(args.retry_after), '--extra-populations', str(args.extra_populations)]
+    if args.recording:
+        options += ['--recording', args.recording]
+    process, url = Startstandin(options)
+    Snpcore.EUTILS_SERVER = Snpcore.ENSEMBL_SERVER = url
+    Snpcore.CACHE = None
+    Snphttp.CLIENT.set_rate(urlsplit(url).hostname, args.rate)
+    model = None if args.no_render else Rendermodel()
+    print(f'stand-in {url}: latency {args.latency}s, throttle {args.throttle}, batch size {args.batch_size}, '
+          f'inflight {args.inflight}, render {"on" if model is not None else "off"}')
+    print(f"{'variants':>9}{'seconds':>9}{'var/s':>8}{'MB':>8}" + ''.join(f'{stage:>9}' for stage in STAGES))
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as folder:
+            for size in args.sizes:
+                result = results[str(size)] = Run(size, args, model, folder)
+                print(f"{size:>9}{result['seconds']:>9.2f}{result['throughput']:>8.0f}{result['bytes'] / 1e6:>8.1f}" +
+                      ''.join(f"{result['stages'].get(stage, 0):>9.3f}" for stage in STAGES))
+    finally:
+        process.terminate()
+        process.wait()
+    print('stage columns: seconds summed over the spans, concurrent requests add up to more than the wall time')
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(results, handle, indent=1)
+    if args.baseline:
+        with open(args.baseline) as handle:
+            messages = Compare(results, json.load(handle), args.tolerance)
+        for message in messages:
+            print(f'REGRESSION {message}')
+        return 1 if messages else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
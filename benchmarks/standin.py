@@ -0,0 +1,342 @@
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import random
+import signal
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Snpcore
+import Snpcache
+
+
+# Constants
+###########################################################################################
+RELEASE = 111
+# Synthetic records are cloned from this many templates
+TEMPLATES = 64
+# Hits of the esearch terms that are neither recorded nor a region
+DEFAULT_HITS = 1000
+# Ensembl option -> record key it adds
+OPTION_KEYS = {'pops': 'populations', 'phenotypes': 'phenotypes',
+               'population_genotypes': 'population_genotypes'}
+REGION = re.compile(r'(\d+)\[CHRPOS\]\s*:\s*(\d+)\[CHRPOS\]')
+# Placeholders of the cloned template records
+NAME = '__RSID__'
+LOCATION = '__LOCATION__'
+POSITION = '__POSITION__'
+
+
+# Synthetic records
+###########################################################################################
+
+def Syntheticvariant(i, populations, extra=0):
+    '''Creates a decoded Ensembl variation record of rsID i with allele frequencies for the populations
+            (and extra made up ones) and genotype frequencies for the 1000 Genomes ones'''
+    rnd = random.Random(i)
+    minor, major = rnd.sample('ACGT', 2)
+    alleles, genotypes = [], []
+    for population in list(populations) + [f'standin:extra{n}' for n in range(extra)]:
+        frequency = round(rnd.random() * 0.5, 4)
+        alleles.append({'population': population, 'allele': minor, 'frequency': frequency,
+                        'allele_count': int(frequency * 5008), 'submission_id': f'ss{i}'})
+        alleles.append({'population': population, 'allele': major, 'frequency': round(1 - frequency, 4),
+                        'allele_count': int((1 - frequency) * 5008), 'submission_id': f'ss{i}'})
+        if population.startswith('1000GENOMES') or population.startswith('standin'):
+            for genotype, value in ((f'{minor}|{minor}', frequency ** 2),
+                                    (f'{minor}|{major}', 2 * frequency * (1 - frequency)),
+                                    (f'{major}|{major}', (1 - frequency) ** 2)):
+                genotypes.append({'population': population, 'genotype': genotype,
+                                  'frequency': round(value, 4), 'count': int(value * 2504),
+                                  'subsnp_id': f'ss{i}'})
+    return {'name': f'rs{i}', 'var_class': 'SNP', 'source': 'Variants (including SNPs and indels) imported from dbSNP',
+            'minor_allele': minor, 'MAF': round(rnd.random() * 0.5, 4),
+            'most_severe_consequence': rnd.choice(['missense_variant', 'intron_variant', 'synonymous_variant']),
+            'clinical_significance': rnd.sample(['drug response', 'benign', 'pathogenic'], rnd.randint(0, 2)),
+            'mappings': [{'location': f'8:{i}-{i}', 'allele_string': f'{major}/{minor}', 'ancestral_allele': major,
+                          'seq_region_name': '8', 'start': i, 'end': i, 'strand': 1,
+                          'assembly_name': 'GRCh38', 'coord_system': 'chromosome'}],
+            'populations': alleles, 'population_genotypes': genotypes,
+            'phenotypes': [{'trait': f'Trait {rnd.randint(1, 50)}', 'risk_allele': rnd.choice([minor, major]),
+                            'genes': 'NAT2', 'source': 'NHGRI-EBI GWAS catalog'}
+                           for n in range(rnd.randint(0, 3))]}
+
+
+# Recording class
+###########################################################################################
+class Recording():
+    '''esearch results and Ensembl variation records recorded from the real services,
+    saved as json (gzipped when the file name ends with .gz)'''
+
+    def __init__(self, path=None):
+        self.path = path
+        self.esearch = {}
+        self.variation = {}
+        self.lock = threading.Lock()
+        if path and os.path.exists(path):
+            with (gzip.open(path, 'rt') if path.endswith('.gz') else open(path)) as handle:
+                data = json.load(handle)
+            self.esearch = data.get('esearch', {})
+            self.variation = data.get('variation', {})
+
+    def addpage(self, term, retstart, count, ids):
+        with self.lock:
+            search = self.esearch.setdefault(term, {'count': count, 'idlist': []})
+            search['count'] = count
+            if retstart == len(search['idlist']):
+                search['idlist'].extend(ids)
+
+    def addrecords(self, decoded):
+        with self.lock:
+            for rsid, record in decoded.items():
+                self.variation.setdefault(rsid, {}).update(record)
+
+    def save(self, path=None):
+        path = path or self.path
+        with self.lock:
+            data = {'esearch': self.esearch, 'variation': self.variation}
+        with (gzip.open(path, 'wt') if path.endswith('.gz') else open(path, 'w')) as handle:
+            json.dump(data, handle)
+
+
+# Stand-in server
+###########################################################################################
+class Standin(ThreadingHTTPServer):
+    '''Local stand-in for the NCBI E-utilities esearch and the Ensembl variation endpoints.
+    Recorded responses are replayed; rsIDs and terms that were not recorded get synthetic ones
+    (a region term returns one SNP per base pair, rsID = position). With upstream servers it proxies
+    to them and records their responses instead. Latency, throttling (429 with Retry-After) and the
+    payload size of the synthetic records are configurable.'''
+
+    daemon_threads = True
+
+    def __init__(self, address, recording=None, latency=0.0, jitter=0.0, throttle=0.0, retry_after=1.0,
+                 populations=None, extra=0, hits=DEFAULT_HITS, upstream=None, seed=0):
+        super(Standin, self).__init__(address, Handler)
+        self.recording = recording or Recording()
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.hits = hits
+        self.upstream = upstream
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.histories = []
+        self.recordedterms = {}
+        self.requests = 0
+        self.throttled = 0
+        self.sent = 0
+        populations = populations or [population for population, label in
+                                      Snpcore.POPULATION_SETS['1000G'] + Snpcore.POPULATION_SETS['gnomADg']]
+        self.templates = [Syntheticvariant(i, populations, extra) for i in range(1, TEMPLATES + 1)]
+        self.fragments = {}
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def delay(self):
+        '''Sleeps the latency of a request, Output = True if the request is to be throttled'''
+        with self.lock:
+            self.requests += 1
+            wait = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            throttled = self.random.random() < self.throttle
+            self.throttled += throttled
+        time.sleep(wait)
+        return throttled
+
+    def esearch(self, query):
+        '''Returns the esearchresult of an esearch query'''
+        retstart = int(query.get('retstart', ['0'])[0])
+        retmax = int(query.get('retmax', ['20'])[0])
+        if 'WebEnv' in query:
+            term = self.histories[int(query['WebEnv'][0][1:])]
+        else:
+            term = query.get('term', [''])[0]
+        recorded = self.recording.esearch.get(term)
+        if recorded:
+            count, ids = recorded['count'], recorded['idlist'][retstart:retstart + retmax]
+        else:
+            region = REGION.search(term)
+            first, last = (int(region.group(1)), int(region.group(2))) if region else (1, self.hits)
+            count = last - first + 1
+            ids = [str(i) for i in range(first + retstart, min(first + retstart + retmax, last + 1))]
+        result = {'count': str(count), 'retmax': str(len(ids)), 'retstart': str(retstart), 'idlist': ids}
+        if query.get('usehistory', [''])[0] == 'y':
+            with self.lock:
+                self.histories.append(term)
+                result.update(webenv=f'W{len(self.histories) - 1}', querykey='1')
+        return {'esearchresult': result}
+
+    def recordpage(self, query, data):
+        '''Records an esearch page proxied from the real E-utilities'''
+        result = data['esearchresult']
+        if 'term' in query:
+            term = query['term'][0]
+            if 'webenv' in result:
+                self.recordedterms[result['webenv']] = term
+        else:
+            term = self.recordedterms.get(query.get('WebEnv', [''])[0], '')
+        self.recording.addpage(term, int(query.get('retstart', ['0'])[0]), int(result['count']),
+                               result['idlist'])
+
+    def fragment(self, template, options):
+        '''Returns the json of a template record with only the keys of the options,
+                its rsID, location and position left as placeholders'''
+        key = (template, options)
+        if key not in self.fragments:
+            record = dict(self.templates[template], name=NAME)
+            record['mappings'] = [dict(record['mappings'][0], location=LOCATION, start=POSITION, end=POSITION)]
+            for option, field in OPTION_KEYS.items():
+                if option not in options:
+                    record.pop(field, None)
+            self.fragments[key] = json.dumps(record).replace(f'"{POSITION}"', POSITION)
+        return self.fragments[key]
+
+    def variation(self, ids, options):
+        '''Returns the json body of the records of the rsIDs'''
+        fields = [OPTION_KEYS[option] for option in options if option in OPTION_KEYS]
+        parts = []
+        for rsid in ids:
+            rsid = str(rsid).lower()
+            if rsid in self.recording.variation:
+                record = {key: value for key, value in self.recording.variation[rsid].items()
+                          if key not in OPTION_KEYS.values() or key in fields}
+                parts.append(f'"{rsid}": {json.dumps(record)}')
+                continue
+            number = rsid.strip('rs')
+            text = self.fragment(int(number) % TEMPLATES, options)
+            text = text.replace(NAME, rsid).replace(LOCATION, f'8:{number}-{number}').replace(POSITION, number)
+            parts.append(f'"{rsid}": {text}')
+        return ('{' + ', '.join(parts) + '}').encode()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.sent += len(body)
+
+    def throttled(self):
+        if self.server.delay():
+            self.reply(b'{"error": "Too many requests"}', 429,
+                       {'Retry-After': str(self.server.retry_after)})
+            return True
+        return False
+
+    def proxy(self, method, server, body=None):
+        '''Forwards the request to the upstream server, Output = the decoded response'''
+        import requests
+        response = requests.request(method, server + self.path, data=body,
+                                    headers={'Content-Type': 'application/json', 'Accept': 'application/json'})
+        response.raise_for_status()
+        return response.json()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path.endswith('/esearch.fcgi'):
+            if self.server.upstream:
+                data = self.proxy('GET', self.server.upstream[0])
+                self.server.recordpage(query, data)
+                self.reply(json.dumps(data).encode())
+            elif not self.throttled():
+                self.reply(json.dumps(self.server.esearch(query)).encode())
+        elif url.path.startswith('/info/data'):
+            self.reply(json.dumps({'releases': [RELEASE]}).encode())
+        elif url.path.startswith('/variation/human/') and not self.server.upstream:
+            # the summary of one SNP in the GUI
+            if not self.throttled():
+                rsid = url.path.rsplit('/', 1)[1].lower()
+                body = self.server.variation([rsid], Snpcache.Flags(self.path))
+                self.reply(json.dumps(json.loads(body)[rsid]).encode())
+        else:
+            self.reply(b'{"error": "not found"}', 404)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not url.path.startswith('/variation/homo_sapiens'):
+            self.reply(b'{"error": "not found"}', 404)
+        elif self.server.upstream:
+            decoded = self.proxy('POST', self.server.upstream[1], body)
+            self.server.recording.addrecords(decoded)
+            self.reply(json.dumps(decoded).encode())
+        elif not self.throttled():
+            options = Snpcache.Flags(self.path)
+            self.reply(self.server.variation(json.loads(body)['ids'], options))
+
+
+def Start(**kwargs):
+    '''Starts a stand-in server on a free local port in a background thread, Output = the server'''
+    server = Standin(('127.0.0.1', kwargs.pop('port', 0)), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Local stand-in for the NCBI esearch and Ensembl variation endpoints, replaying recorded '
+        'responses. Point SNPfinder at it with SNPOP_EUTILS_SERVER and SNPOP_ENSEMBL_SERVER.')
+    parser.add_argument('--port', type=int, default=0, help='port to listen on (default: a free one)')
+    parser.add_argument('--recording', help='json(.gz) file of recorded responses to replay (or to record to)')
+    parser.add_argument('--record', action='store_true',
+                        help='proxy to the real services and record their responses to --recording')
+    parser.add_argument('--eutils', default='https://eutils.ncbi.nlm.nih.gov', help='E-utilities server recorded')
+    parser.add_argument('--ensembl', default='https://rest.ensembl.org', help='Ensembl REST server recorded')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random +- seconds added to the latency')
+    parser.add_argument('--throttle', type=float, default=0.0,
+                        help='fraction of the requests answered with 429 Too Many Requests')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds of the 429 responses')
+    parser.add_argument('--populations', nargs='*', default=['1000G', 'gnomADg'],
+                        help='population sets of the synthetic records')
+    parser.add_argument('--extra-populations', type=int, default=0,
+                        help='made up populations added to every synthetic record, to grow the payloads')
+    parser.add_argument('--hits', type=int, default=DEFAULT_HITS, help='hits of the synthetic gene searches')
+    args = parser.parse_args(argv)
+    if args.record and not args.recording:
+        parser.error('--record needs the --recording file')
+
+    recording = Recording(args.recording)
+    server = Start(port=args.port, recording=recording, latency=args.latency, jitter=args.jitter,
+                   throttle=args.throttle, retry_after=args.retry_after,
+                   populations=[p for p, label in Snpcore.Populations(args.populations)],
+                   extra=args.extra_populations, hits=args.hits,
+                   upstream=(args.eutils, args.ensembl) if args.record else None)
+    print(server.url, flush=True)
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        if args.record:
+            recording.save()
+            print(f'{len(recording.esearch)} searches, {len(recording.variation)} variants recorded to '
+                  f'{args.recording}', file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
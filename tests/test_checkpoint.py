@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import Snpjob
+
+EXT = '/variation/homo_sapiens?pops=1'
+
+
+class Checkpointtest(unittest.TestCase):
+    '''Opening, replaying and repairing the checkpoint folder'''
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_settings(self):
+        Snpjob.Checkpoint(self.folder, {'queries': ['NAT2'], 'all': True})
+        Snpjob.Checkpoint(self.folder, {'queries': ['NAT2'], 'all': True})
+        with self.assertRaises(ValueError):
+            Snpjob.Checkpoint(self.folder, {'queries': ['BRCA1'], 'all': True})
+
+    def test_replay(self):
+        checkpoint = Snpjob.Checkpoint(self.folder)
+        checkpoint.addpage('NAT2', [1, 2, 3], 5)
+        checkpoint.addpage('NAT2', [4, 5], 5)
+        checkpoint.addrecords(EXT, {'rs1': '{"name": "rs1"}', 'rs2': '{\n"name": "rs2"}'}, encoded=True)
+        checkpoint.addbatch(EXT, ['rs1', 'rs2'])
+        checkpoint.addrecords(EXT, {'rs3': {'name': 'rs3'}})
+        checkpoint.addbatch(EXT, ['rs3', 'rs4'])
+        # records of a batch that never finished are not used
+        checkpoint.addrecords(EXT, {'rs5': {'name': 'rs5'}})
+        checkpoint = Snpjob.Checkpoint(self.folder)
+        self.assertEqual(checkpoint.searched('NAT2'), [([1, 2, 3], 5), ([4, 5], 5)])
+        done, records = checkpoint.fetched(EXT, ['rs1', 'rs2', 'rs3', 'rs4', 'rs5'])
+        self.assertEqual(done, {'rs1', 'rs2', 'rs3', 'rs4'})
+        self.assertEqual(records, {rsid: {'name': rsid} for rsid in ['rs1', 'rs2', 'rs3']})
+        self.assertEqual(checkpoint.fetched('/variation/homo_sapiens?phenotypes=1', ['rs1']), (set(), {}))
+
+    def test_torn_line(self):
+        checkpoint = Snpjob.Checkpoint(self.folder)
+        checkpoint.addpage('NAT2', [1, 2], 2)
+        checkpoint.addrecords(EXT, {'rs1': {'name': 'rs1'}})
+        checkpoint.addbatch(EXT, ['rs1'])
+        size = os.path.getsize(checkpoint.journal)
+        with open(checkpoint.journal, 'a') as handle:
+            handle.write('{"kind": "batch", "ext": "' + EXT + '", "ids": ["rs2"')
+        checkpoint = Snpjob.Checkpoint(self.folder)
+        self.assertEqual(os.path.getsize(checkpoint.journal), size)
+        self.assertEqual(checkpoint.fetched(EXT, ['rs1', 'rs2'])[0], {'rs1'})
+        checkpoint.addbatch(EXT, ['rs2'])
+        self.assertEqual(Snpjob.Checkpoint(self.folder).fetched(EXT, ['rs1', 'rs2'])[0], {'rs1', 'rs2'})
+
+
+class Resumetest(unittest.TestCase):
+    '''Kills a command line job against the stand-in server partway and resumes it from its checkpoint'''
+
+    QUERY = '8:1-400'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'standin.py'),
+                                       '--latency', '0.05'], stdout=subprocess.PIPE, text=True)
+        url = cls.server.stdout.readline().strip()
+        # another host name for Ensembl, so it isn't held to the E-utilities rate limit
+        cls.environment = dict(os.environ, SNPOP_EUTILS_SERVER=url,
+                               SNPOP_ENSEMBL_SERVER=url.replace('127.0.0.1', 'localhost'))
+        cls.folder = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.wait()
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def command(self, output, checkpoint=None, query=QUERY):
+        command = [sys.executable, os.path.join(ROOT, 'Snpcore.py'), query, '--all', '--no-cache',
+                   '--batch-size', '20', '--inflight', '1', '-o', output]
+        return command + (['--checkpoint', checkpoint] if checkpoint else [])
+
+    def run_command(self, command):
+        return subprocess.run(command, env=self.environment, capture_output=True, text=True, timeout=120)
+
+    def test_resume(self):
+        expected = os.path.join(self.folder, 'expected.csv')
+        output = os.path.join(self.folder, 'resumed.csv')
+        checkpoint = os.path.join(self.folder, 'checkpoint')
+        self.assertEqual(self.run_command(self.command(expected)).returncode, 0)
+
+        job = subprocess.Popen(self.command(output, checkpoint), env=self.environment,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        journal = os.path.join(checkpoint, Snpjob.JOURNAL)
+        end = time.monotonic() + 60
+        while time.monotonic() < end and job.poll() is None:
+            if os.path.exists(journal):
+                with open(journal) as handle:
+                    if handle.read().count('"kind": "batch"') >= 5:
+                        break
+            time.sleep(0.02)
+        job.kill()
+        job.wait()
+        self.assertFalse(os.path.exists(output), 'the job finished before it was killed')
+
+        resumed = self.run_command(self.command(output, checkpoint))
+        self.assertEqual(resumed.returncode, 0, resumed.stderr)
+        self.assertIn('resuming after', resumed.stderr)
+        with open(expected) as handle, open(output) as other:
+            self.assertEqual(other.read(), handle.read())
+
+        # a different job is refused
+        other = self.run_command(self.command(output, checkpoint, '8:1-500'))
+        self.assertEqual(other.returncode, 2)
+        self.assertIn('checkpoint of a different job', other.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import Snpcore
+import Snphttp
+import standin
+
+
+class Esearchpages(unittest.TestCase):
+    '''Pages through a search against the stand-in server, which (like the E-utilities) only
+    returns the history of the search (WebEnv, query_key) with the first page'''
+
+    QUERY = '8:1-35'
+    PAGE = 10
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = standin.Start()
+        cls.saved = (Snpcore.EUTILS_SERVER, Snpcore.ENSEMBL_SERVER, Snpcore.ESEARCH_PAGE, Snpcore.CACHE)
+        Snpcore.EUTILS_SERVER = Snpcore.ENSEMBL_SERVER = cls.server.url
+        Snpcore.ESEARCH_PAGE = cls.PAGE
+        Snpcore.CACHE = None
+        Snphttp.CLIENT.set_rate(urlsplit(cls.server.url).hostname, 1000)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        Snpcore.EUTILS_SERVER, Snpcore.ENSEMBL_SERVER, Snpcore.ESEARCH_PAGE, Snpcore.CACHE = cls.saved
+
+    def test_pages(self):
+        pages = list(Snpcore.esearch_pages(self.QUERY, 'No Filtering'))
+        self.assertEqual([len(page) for page, count in pages], [10, 10, 10, 5])
+        self.assertEqual(sum((page for page, count in pages), []), list(range(1, 36)))
+
+    def test_async_pages(self):
+        try:
+            import Snpasync
+        except ImportError:
+            self.skipTest('aiohttp is not installed')
+        rows = Snpasync.Getdata([self.QUERY], fetch_all=True)
+        self.assertEqual([row[0] for row in rows], [f'rs{n}' for n in range(1, 36)])
+
+
+if __name__ == "__main__":
+    unittest.main()
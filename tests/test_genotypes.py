@@ -0,0 +1,70 @@
+import os
+import sys
+import math
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Snpcore
+
+
+class Genotypeclasstest(unittest.TestCase):
+    '''Classes of the genotypes by their number of minor alleles (indexes in Snpcore.GENOTYPES)'''
+
+    HETEROZYGOUS, MINOR, MAJOR = (Snpcore.GENOTYPES.index(genotype) for genotype in
+                                  ('heterozygous', 'minorhomozygous', 'majorhomozygous'))
+
+    def test_unphased(self):
+        for genotype in ('A|G', 'A/G', 'G|A', 'G/A'):
+            self.assertEqual(Snpcore.Genotypeclass(genotype, 'G'), self.HETEROZYGOUS)
+        self.assertEqual(Snpcore.Genotypeclass('G/G', 'G'), Snpcore.Genotypeclass('G|G', 'G'))
+        self.assertEqual(Snpcore.Genotypeclass('A/A', 'G'), Snpcore.Genotypeclass('A|A', 'G'))
+
+    def test_multiallelic(self):
+        # at an A/C/T site with minor allele A, genotypes without it count as major homozygous
+        self.assertEqual(Snpcore.Genotypeclass('C|T', 'A'), self.MAJOR)
+        self.assertEqual(Snpcore.Genotypeclass('T|T', 'A'), self.MAJOR)
+        self.assertEqual(Snpcore.Genotypeclass('A|T', 'A'), self.HETEROZYGOUS)
+        self.assertEqual(Snpcore.Genotypeclass('A|A', 'A'), self.MINOR)
+
+    def test_haploid(self):
+        self.assertEqual(Snpcore.Genotypeclass('A', 'A'), self.MINOR)
+        self.assertEqual(Snpcore.Genotypeclass('G', 'A'), self.MAJOR)
+
+    def test_missing_minor_allele(self):
+        for genotype in ('A|G', 'A/A', 'G'):
+            self.assertEqual(Snpcore.Genotypeclass(genotype, None), self.MAJOR)
+        record = {'population_genotypes': [{'population': 'POP1', 'genotype': 'A|G', 'frequency': 0.5},
+                                           {'population': 'POP1', 'genotype': 'A|A', 'frequency': 0.5}]}
+        self.assertEqual(Snpcore.Genotypevalues(record, Snpcore.Populationcolumns([('POP1', 'First')])),
+                         [0, 0, 1.0])
+
+
+class Genotypevaluestest(unittest.TestCase):
+    '''Genotype class frequencies of a population_genotypes=1 record'''
+
+    COLUMNS = Snpcore.Populationcolumns([('POP1', 'First'), ('POP2', 'Second')])
+
+    def test_missing_population(self):
+        record = {'minor_allele': 'G', 'population_genotypes': [
+            {'population': 'POP1', 'genotype': 'A|G', 'frequency': 0.5},
+            {'population': 'POP1', 'genotype': 'G|G', 'frequency': 0.1},
+            {'population': 'POP1', 'genotype': 'A|A', 'frequency': 0.4},
+            {'population': 'OTHER', 'genotype': 'A|A', 'frequency': 1}]}
+        values = Snpcore.Genotypevalues(record, self.COLUMNS)
+        self.assertEqual(values[:3], [0.5, 0.1, 0.4])
+        self.assertTrue(all(math.isnan(value) for value in values[3:]))
+
+    def test_no_genotypes(self):
+        values = Snpcore.Genotypevalues({'minor_allele': 'G'}, self.COLUMNS)
+        self.assertEqual(len(values), 6)
+        self.assertTrue(all(math.isnan(value) for value in values))
+
+    def test_class_without_genotype(self):
+        # a population with genotypes has 0 for the classes none of them fall in
+        record = {'minor_allele': 'G', 'population_genotypes': [
+            {'population': 'POP2', 'genotype': 'A|A', 'frequency': 1}]}
+        self.assertEqual(Snpcore.Genotypevalues(record, self.COLUMNS)[3:], [0, 0, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
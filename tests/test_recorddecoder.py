@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import Snpcore
+
+
+def Decode(body, sizes, keeptext=True):
+    '''Feeds body to a Recorddecoder in chunks of the given sizes (the rest in one chunk)
+            Output = the (rsID, record, text) items decoded'''
+    decoder = Snpcore.Recorddecoder(keeptext)
+    items, position = [], 0
+    for size in sizes:
+        items += decoder.feed(body[position:position + size])
+        position += size
+    items += decoder.feed(body[position:], final=True)
+    return items
+
+
+def Randomsizes(body, rnd):
+    sizes = []
+    while sum(sizes) < len(body):
+        sizes.append(rnd.choice([1, 2, 3, 7, 64, 1000]))
+    return sizes
+
+
+class Recorddecodertest(unittest.TestCase):
+    '''The incremental decoder gives the records json.loads gives, however the body is cut into chunks'''
+
+    RECORDS = {
+        'rs1': {'name': 'rs1', 'minor_allele': 'G', 'MAF': 0.4237, 'count': -12, 'big': 1.5e-7,
+                'synonyms': [], 'ok': True, 'no': False, 'none': None},
+        'rs2': {'trait': 'braces {} [] and "quotes", a \\ backslash, a / slash',
+                'escaped': '\\"}, "rs3": {', 'unicode': 'Gène 中文 \U0001f9ec', 'empty': {}},
+        'rs3': [1, 2.5, 'x', {'nested': [{'deep': '}'}]}],
+        'rs4': 7,
+        'rs5': None,
+        'rs6': 'text',
+    }
+
+    def check(self, body, sizes):
+        items = Decode(body, sizes)
+        expected = json.loads(body)
+        self.assertEqual([rsid for rsid, record, text in items], list(expected))
+        self.assertEqual({rsid: record for rsid, record, text in items}, expected)
+        for rsid, record, text in items:
+            self.assertEqual(json.loads(text), expected[rsid])
+
+    def test_random_chunks(self):
+        rnd = random.Random(1)
+        for dumps in (json.dumps, lambda value: json.dumps(value, ensure_ascii=False),
+                      lambda value: json.dumps(value, indent=2, ensure_ascii=False)):
+            body = dumps(self.RECORDS).encode()
+            for n in range(200):
+                self.check(body, Randomsizes(body, rnd))
+
+    def test_byte_by_byte(self):
+        body = (' \n' + json.dumps(self.RECORDS, ensure_ascii=False) + '\r\n ').encode()
+        self.check(body, [1] * len(body))
+
+    def test_every_cut(self):
+        # multibyte characters, numbers and literals cut at every position of the body
+        body = json.dumps({'rs1': 'é中\U0001f9ec', 'rs2': 123456, 'rs3': -0.5e-3, 'rs4': True,
+                           'rs5': False, 'rs6': None, 'rs7': 10}, ensure_ascii=False).encode()
+        for cut in range(len(body) + 1):
+            self.check(body, [cut])
+
+    def test_empty_object(self):
+        self.assertEqual(Decode(b'{}', [1]), [])
+        self.assertEqual(Decode(b' { } ', [2, 1]), [])
+
+    def test_trailing_data(self):
+        body = json.dumps(self.RECORDS).encode()
+        for extra in (b'x', b'}', b' {}', b'\n,'):
+            for sizes in ([], [len(body)], [1] * (len(body) + len(extra))):
+                with self.assertRaises(ValueError):
+                    Decode(body + extra, sizes)
+
+    def test_truncated(self):
+        body = json.dumps(self.RECORDS).encode()
+        for end in (0, 1, 5, len(body) // 2, len(body) - 1):
+            for sizes in ([], [1] * end):
+                with self.assertRaises(ValueError):
+                    Decode(body[:end], sizes)
+
+    def test_not_an_object(self):
+        for body in (b'[]', b'"rs1"', b'{"rs1" 1}', b'{"rs1": 1 "rs2": 2}', b'{rs1: 1}', b'{"rs1": 1,}'):
+            with self.assertRaises(ValueError):
+                Decode(body, [])
+
+    def test_without_text(self):
+        body = json.dumps(self.RECORDS).encode()
+        self.assertTrue(all(text is None for rsid, record, text in Decode(body, [3] * 100, keeptext=False)))
+
+
+if __name__ == "__main__":
+    unittest.main()